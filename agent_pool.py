@@ -0,0 +1,145 @@
+import os
+import queue
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Agent runs executing at once (threads and agent instances), override with AGENT_CONCURRENCY
+AGENT_CONCURRENCY = int(os.getenv('AGENT_CONCURRENCY', '4'))
+
+# Requests allowed to wait for a free agent before new ones get a 503
+AGENT_QUEUE_DEPTH = int(os.getenv('AGENT_QUEUE_DEPTH', '16'))
+
+# Seconds a request waits for its answer (queue time included)
+AGENT_TIMEOUT = float(os.getenv('AGENT_TIMEOUT', '120'))
+
+
+class PoolFull(Exception):
+    """Raised when AGENT_QUEUE_DEPTH requests are already waiting"""
+
+
+class AgentPool:
+    """Runs agents on a bounded thread pool, off the event loop
+
+    Each worker thread checks out its own agent instance, so concurrent runs
+    never share an agent. At most concurrency runs execute and queue_depth
+    more wait; anything beyond that is refused with PoolFull.
+    """
+
+    def __init__(self, make_agent, concurrency=AGENT_CONCURRENCY, queue_depth=AGENT_QUEUE_DEPTH,
+                 timeout=AGENT_TIMEOUT):
+        self._make_agent = make_agent
+        self._agents = queue.LifoQueue()
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='agent')
+        self._slots = threading.BoundedSemaphore(concurrency + queue_depth)
+        self._lock = threading.Lock()
+        self.concurrency = concurrency
+        self.queue_depth = queue_depth
+        self.timeout = timeout
+        self.created = 0
+        self.pending = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def submit(self, fn, *args):
+        """Start fn(agent, *args) on the pool and return its concurrent Future"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise PoolFull(f"{self.pending} agent requests already in progress")
+        with self._lock:
+            self.pending += 1
+        future = self._executor.submit(self._call, fn, *args)
+        # The slot is held until the run ends (or is cancelled before starting),
+        # not until the caller gives up waiting
+        future.add_done_callback(self._release)
+        return future
+
+    async def run(self, fn, *args):
+        """Await fn(agent, *args); raises PoolFull or asyncio.TimeoutError"""
+        future = self.submit(fn, *args)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.timeouts += 1
+            raise
+
+    def stream(self, fn, *args):
+        """Start iterating fn(agent, *args) on the pool; returns an async iterator of its items
+
+        Raises PoolFull straight away, before anything is streamed. Waiting longer
+        than timeout for the next item raises asyncio.TimeoutError. If the
+        consumer stops early the worker stops at its next item.
+        """
+        loop = asyncio.get_running_loop()
+        items = asyncio.Queue()
+        stopped = threading.Event()
+
+        def put(done, item):
+            if not stopped.is_set():
+                loop.call_soon_threadsafe(items.put_nowait, (done, item))
+
+        def produce(agent, *args):
+            try:
+                for item in fn(agent, *args):
+                    if stopped.is_set():
+                        return
+                    put(False, item)
+            except Exception as e:
+                put(True, e)
+            else:
+                put(True, None)
+
+        self.submit(produce, *args)
+
+        async def consume():
+            try:
+                while True:
+                    try:
+                        done, item = await asyncio.wait_for(items.get(), self.timeout)
+                    except asyncio.TimeoutError:
+                        with self._lock:
+                            self.timeouts += 1
+                        raise
+                    if done:
+                        if item is not None:
+                            raise item
+                        return
+                    yield item
+            finally:
+                stopped.set()
+
+        return consume()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'concurrency': self.concurrency,
+                'queue_depth': self.queue_depth,
+                'pending': self.pending,
+                'agents': self.created,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts,
+            }
+
+    def _call(self, fn, *args):
+        agent = self._checkout()
+        try:
+            return fn(agent, *args)
+        finally:
+            self._agents.put(agent)
+
+    def _checkout(self):
+        try:
+            return self._agents.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                self.created += 1
+            return self._make_agent()
+
+    def _release(self, future):
+        with self._lock:
+            self.pending -= 1
+        self._slots.release()
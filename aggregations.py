@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+
+from database import read_sql
+
+
+MONTH_NAMES = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
+               'August', 'September', 'October', 'November', 'December']
+
+# Dimensions every dashboard breakdown is derived from
+DASHBOARD_DIMENSIONS = ['Year', 'Month', 'Month Name', 'Weeks', 'Quarter', 'Class', 'Branch']
+
+
+def premium_projection(where_clause, params=None):
+    """Fetch SUM(Premium) per dashboard dimension combination in a single cube scan"""
+    dimensions = ', '.join(f'[{col}]' for col in DASHBOARD_DIMENSIONS)
+    query = f"""
+    SELECT {dimensions}, SUM(Premium) as Premium
+    FROM premium_cube
+    WHERE {where_clause}
+    GROUP BY {dimensions}
+    """
+    return read_sql(query, params)
+
+
+SUMMARY_QUERY = """
+SELECT SUM(Premium) as Total_Premium,
+       SUM(CASE WHEN [Trans Type] = 'New Business' THEN Premium END) as New_Business,
+       SUM(CASE WHEN [Trans Type] = 'Renewal' THEN Premium END) as Renewal_Business,
+       SUM(Transactions) as Transactions
+FROM premium_cube
+WHERE {where_clause}
+"""
+
+
+def premium_summary(where_clause, params=None):
+    """Summary card figures for one filter in a single cube scan
+
+    Returns Total_Premium, New_Business, Renewal_Business and Transactions;
+    each is None when no rows match, like SUM() in SQL.
+    """
+    row = read_sql(SUMMARY_QUERY.format(where_clause=where_clause), params).astype(object).iloc[0]
+    return {key: (None if pd.isna(value) else value) for key, value in row.items()}
+
+
+def summarize(df):
+    """premium_summary() for a projection that has already been fetched"""
+    def total(values):
+        return values.sum() if len(values) else None
+
+    trans_type = df['Trans Type']
+    return {
+        'Total_Premium': total(df['Premium']),
+        'New_Business': total(df.loc[trans_type == 'New Business', 'Premium']),
+        'Renewal_Business': total(df.loc[trans_type == 'Renewal', 'Premium']),
+        'Transactions': total(df['Transactions']),
+    }
+
+
+def _sum_by(df, keys):
+    return df.groupby(keys, dropna=False, sort=True)['Premium'].sum(min_count=1)
+
+
+def _year_comparison(df, keys, current_year, previous_year):
+    """Current vs previous year premium per key with the percentage change"""
+    year = df['Year']
+    premium = df['Premium'].fillna(0)
+    frame = df[keys].assign(
+        Current_Year_Premium=premium.where(year == current_year, 0),
+        Previous_Year_Premium=premium.where(year == previous_year, 0),
+    )
+    result = frame.groupby(keys, dropna=False, sort=True, as_index=False).sum()
+    previous = result['Previous_Year_Premium'].replace(0, np.nan)
+    result['Percentage_Change'] = ((result['Current_Year_Premium'] - previous) * 100.0 / previous).round(2)
+    return result
+
+
+def dashboard_frames(projection, years, current_year, previous_year):
+    """Derive every dashboard breakdown from one premium projection
+
+    The projection is filtered by everything except Year; the year filter is
+    applied here so the year-on-year comparisons can reuse the same rows.
+    """
+    selected = projection[projection['Year'].isin(years)]
+
+    # Weekly-Monthly: weeks down, months across
+    weekly_monthly = selected.pivot_table(index='Weeks', columns='Month Name', values='Premium',
+                                          aggfunc='sum', fill_value=0)
+    weekly_monthly = weekly_monthly.reindex(columns=MONTH_NAMES, fill_value=0)
+    weekly_monthly.columns = [name[:3] for name in MONTH_NAMES]
+    weekly_monthly = weekly_monthly.reset_index()
+
+    class_df = _sum_by(selected, 'Class').rename('Total_Premium').reset_index()
+
+    trend_df = _sum_by(selected, ['Month', 'Month Name']).rename('Total_Premium').reset_index()
+    trend_df = trend_df[['Month Name', 'Total_Premium']]
+
+    quarter_df = _sum_by(selected, 'Quarter').rename('Total_Premium').reset_index()
+
+    branch_df = _sum_by(selected, 'Branch').rename('Total_Premium').reset_index()
+
+    class_comparison_df = _year_comparison(projection, ['Class'], current_year, previous_year)
+
+    # Grouping by the integer Month keeps the months in calendar order
+    monthly_comparison_df = _year_comparison(projection, ['Month', 'Month Name'], current_year, previous_year)
+    monthly_comparison_df = monthly_comparison_df.drop(columns='Month')
+
+    return {
+        'weekly_monthly': weekly_monthly,
+        'class': class_df,
+        'trend': trend_df,
+        'quarter': quarter_df,
+        'branch': branch_df,
+        'class_comparison': class_comparison_df,
+        'monthly_comparison': monthly_comparison_df,
+    }
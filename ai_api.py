@@ -8,9 +8,15 @@ from phi.model.google import Gemini
 from tools_gpt import SQLStatsTools
 from dotenv import load_dotenv
 import os
+import json
+import asyncio
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 from selenium_main import get_policy_info
+from database import DB_PATH, data_version
+from agent_pool import AgentPool, PoolFull
+from chat_memory import ConversationMemory
+from answer_cache import answer_cache
 
 # Load environment variables
 load_dotenv()
@@ -28,7 +34,7 @@ app.add_middleware(
 )
 
 # Database configuration
-db_url = 'sqlite:///insurance_data.db'
+db_url = f'sqlite:///{DB_PATH}'
 
 # Initialize the AI agent
 # policy_finder = Agent(
@@ -47,38 +53,45 @@ db_url = 'sqlite:///insurance_data.db'
 #         ],
 #         add_context=True
 #     )
-sql_agent = Agent(
-    tools=[SQLStatsTools(db_url=db_url)],
-    model=Groq(id='llama3-70b-8192'),
-    # model=Gemini(id='gemini-1.5-flash'),
-    markdown=True,
-    description="You are a data and sql analyst good in running database queries and also an Insurance Service Assistant",
-    instructions=[
-        'the database is called insurance_db and the table is called insurance_transactions',
-        '''columns and their datatypes are [Transaction Date] TEXT, [Policy No] TEXT, [Trans Type] TEXT, 
-        Branch TEXT, Class TEXT, [Dr/Cr No] TEXT, [Risk ID] TEXT,
-        Insured TEXT, [Intermediary Type] TEXT, Intermediary TEXT,
-        Marketer TEXT, WEF TEXT, WET TEXT, CURRENCY TEXT,
-        [Sum Insured] REAL, Premium REAL, PAID REAL,
-        Year INTEGER, [Month Name] TEXT, Month INTEGER,
-        Quarter INTEGER, Weeks INTEGER''',
-        'When given a question use your mind to know which query need to be done based on the question',
-        'Use the tool provided to do any in depth analysis if any',
-        'You are an sqlite database expert in running queries',
-        'Answer like an customer service and an analyst',
-        "Make your answers simple and short",
-        "Provide Summary and Suggestions if necessary",
-        "Any Questions Out of Context tell them to review their question",
-        "With the intermediary, if the user asked for ranking exclude DIRECT or DIRECT DIRECT",
-        'Learn from the user sometimes and also minimize error',
-        'The currency is GH₵'
-        "" 
-    ],
-    add_context=True,
-    add_history_to_messages=True,
-    # Number of historical responses to add to the messages.
-    num_history_responses=3
-)
+def make_sql_agent():
+    """A new SQL analyst agent; the pool keeps one per concurrent request"""
+    return Agent(
+        tools=[SQLStatsTools(db_url=db_url)],
+        model=Groq(id='llama3-70b-8192'),
+        # model=Gemini(id='gemini-1.5-flash'),
+        markdown=True,
+        description="You are a data and sql analyst good in running database queries and also an Insurance Service Assistant",
+        instructions=[
+            'the database is called insurance_db and the table is called insurance_transactions',
+            '''columns and their datatypes are [Transaction Date] TEXT, [Policy No] TEXT, [Trans Type] TEXT, 
+            Branch TEXT, Class TEXT, [Dr/Cr No] TEXT, [Risk ID] TEXT,
+            Insured TEXT, [Intermediary Type] TEXT, Intermediary TEXT,
+            Marketer TEXT, WEF TEXT, WET TEXT, CURRENCY TEXT,
+            [Sum Insured] REAL, Premium REAL, PAID REAL,
+            Year INTEGER, [Month Name] TEXT, Month INTEGER,
+            Quarter INTEGER, Weeks INTEGER, [Date Key] INTEGER''',
+            '[Transaction Date], WEF and WET are YYYY-MM-DD text; [Date Key] is the transaction date as YYYYMMDD',
+            'When given a question use your mind to know which query need to be done based on the question',
+            'Use the tool provided to do any in depth analysis if any',
+            'You are an sqlite database expert in running queries',
+            'Answer like an customer service and an analyst',
+            "Make your answers simple and short",
+            "Provide Summary and Suggestions if necessary",
+            "Any Questions Out of Context tell them to review their question",
+            "With the intermediary, if the user asked for ranking exclude DIRECT or DIRECT DIRECT",
+            'Learn from the user sometimes and also minimize error',
+            'The currency is GH₵'
+            "" 
+        ],
+        add_context=True,
+        # History comes from chat_memory per session, not from the pooled agent
+        add_history_to_messages=False
+    )
+
+
+agent_pool = AgentPool(make_sql_agent)
+memory = ConversationMemory()
+
 # bd_team = Agent(
 #     team=[policy_finder, sql_agent],
 #     model=Gemini(id='gemini-1.5-flash'),
@@ -94,15 +107,98 @@ sql_agent = Agent(
 # )
 class ChatRequest(BaseModel):
     message: str
+    session_id: Optional[str] = None
+
+def start_run(agent, session_id):
+    """Forget the pooled agent's previous run; return this session's history"""
+    agent.memory.clear()
+    return memory.messages(session_id)
+
+def remember(session_id, message, answer, history, version):
+    memory.add(session_id, message, answer)
+    # Follow-ups depend on the conversation, so only opening questions are cached
+    if not history:
+        answer_cache.put(message, answer, version)
+
+def cached_answer(request):
+    """A cached answer to the request's question, recorded in its session, or None"""
+    # Only opening questions are cached, and only they may be answered from it
+    if memory.history(request.session_id):
+        return None
+    answer = answer_cache.get(request.message)
+    if answer is not None:
+        memory.add(request.session_id, request.message, answer)
+    return answer
+
+def run_agent(agent, message, session_id, version):
+    history = start_run(agent, session_id)
+    answer = agent.run(message, messages=history).content
+    remember(session_id, message, answer, history, version)
+    return answer
 
 @app.post("/chat")
 async def chat_endpoint(request: ChatRequest):
+    version = data_version()
+    answer = cached_answer(request)
+    if answer is not None:
+        return {"response": answer, "cached": True}
     try:
-        response = sql_agent.run(request.message)
-        return {"response": response.content}
+        response = await agent_pool.run(run_agent, request.message, request.session_id, version)
+        return {"response": response}
+    except PoolFull:
+        raise HTTPException(status_code=503, detail="The assistant is busy, please try again shortly.",
+                            headers={"Retry-After": "5"})
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="The assistant took too long to answer.")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def stream_agent(agent, message, session_id, version):
+    history = start_run(agent, session_id)
+    answer = []
+    for chunk in agent.run(message, stream=True, messages=history):
+        if chunk.content:
+            answer.append(chunk.content)
+            yield chunk.content
+    remember(session_id, message, ''.join(answer), history, version)
+
+def sse(data, event=None):
+    """One server-sent event with a JSON payload"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """The answer as server-sent events: one per chunk, then a done or error event"""
+    version = data_version()
+    answer = cached_answer(request)
+    if answer is not None:
+        return StreamingResponse(iter([sse(answer), sse("", event="done")]), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache"})
+    try:
+        chunks = agent_pool.stream(stream_agent, request.message, request.session_id, version)
+    except PoolFull:
+        raise HTTPException(status_code=503, detail="The assistant is busy, please try again shortly.",
+                            headers={"Retry-After": "5"})
+
+    async def events():
+        try:
+            async for chunk in chunks:
+                yield sse(chunk)
+        except asyncio.TimeoutError:
+            yield sse("The assistant took too long to answer.", event="error")
+        except Exception as e:
+            yield sse(str(e), event="error")
+        else:
+            yield sse("", event="done")
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/chat/stats")
+async def chat_stats():
+    return {**agent_pool.stats(), 'memory': memory.stats(), 'answer_cache': answer_cache.stats()}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,155 @@
+import os
+import re
+import math
+import time
+import threading
+from collections import Counter, OrderedDict
+
+from database import data_version
+
+
+# Answers kept, override with ANSWER_CACHE_ENTRIES
+ANSWER_CACHE_ENTRIES = int(os.getenv('ANSWER_CACHE_ENTRIES', '256'))
+
+# Seconds an answer is served for, even if the data has not changed
+ANSWER_CACHE_TTL = float(os.getenv('ANSWER_CACHE_TTL', '3600'))
+
+# Cosine similarity (0-1) at which a differently worded question reuses an
+# answer; 0 turns the similarity lookup off and only exact matches are served
+ANSWER_CACHE_SIMILARITY = float(os.getenv('ANSWER_CACHE_SIMILARITY', '0'))
+
+
+def normalize_question(question):
+    """Lower case words and numbers only, so spacing and punctuation do not matter"""
+    return ' '.join(re.findall(r'\w+', question.lower()))
+
+
+def _terms(normalized):
+    """Word and word-pair counts of a normalized question"""
+    words = normalized.split()
+    return Counter(words + [' '.join(pair) for pair in zip(words, words[1:])])
+
+
+def _numbers(normalized):
+    return {word for word in normalized.split() if word.isdigit()}
+
+
+class AnswerCache:
+    """LRU cache of assistant answers keyed by (question, data version)
+
+    Entries expire after ttl seconds and are dropped as soon as the data
+    version moves. With similarity > 0 a miss falls back to the closest cached
+    question by TF-IDF cosine similarity; its numbers (years, top N, ...) must
+    match exactly, as they change the answer while barely moving the score.
+    """
+
+    def __init__(self, max_entries=ANSWER_CACHE_ENTRIES, ttl=ANSWER_CACHE_TTL,
+                 similarity=ANSWER_CACHE_SIMILARITY):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self._entries = OrderedDict()
+        self._doc_freq = Counter()
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, question):
+        """The cached answer to question, or None"""
+        key = normalize_question(question)
+        version = data_version()
+        with self._lock:
+            self._expire(version)
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][1]
+            if self.similarity > 0:
+                match = self._most_similar(key)
+                if match is not None:
+                    self._entries.move_to_end(match)
+                    self.similar_hits += 1
+                    return self._entries[match][1]
+            self.misses += 1
+            return None
+
+    def put(self, question, answer, version=None):
+        """Cache answer; pass the data version read before the answer was computed"""
+        if not answer:
+            return
+        current = data_version()
+        if version is not None and version != current:
+            # The data changed while the question was being answered
+            return
+        key = normalize_question(question)
+        with self._lock:
+            self._expire(current)
+            if key in self._entries:
+                self._remove(key)
+            terms = _terms(key)
+            self._entries[key] = (time.monotonic() + self.ttl, answer, terms)
+            self._doc_freq.update(terms.keys())
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._doc_freq.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.similar_hits + self.misses
+            return {
+                'hits': self.hits,
+                'similar_hits': self.similar_hits,
+                'misses': self.misses,
+                'hit_ratio': round((self.hits + self.similar_hits) / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'similarity': self.similarity,
+                'data_version': self._version,
+            }
+
+    def _expire(self, version):
+        if version != self._version:
+            self._entries.clear()
+            self._doc_freq.clear()
+            self._version = version
+            return
+        now = time.monotonic()
+        for key in [key for key, (expires, _, _) in self._entries.items() if expires <= now]:
+            self._remove(key)
+
+    def _remove(self, key):
+        _, _, terms = self._entries.pop(key)
+        self._doc_freq.subtract(terms.keys())
+
+    def _most_similar(self, key):
+        count = len(self._entries) + 1
+
+        def weights(terms):
+            vector = {term: n * (math.log((1 + count) / (1 + self._doc_freq[term])) + 1)
+                      for term, n in terms.items()}
+            return vector, math.sqrt(sum(w * w for w in vector.values()))
+
+        query, query_norm = weights(_terms(key))
+        numbers = _numbers(key)
+        best, best_score = None, self.similarity
+        for other, (_, _, terms) in self._entries.items():
+            if not query_norm or _numbers(other) != numbers:
+                continue
+            vector, norm = weights(terms)
+            score = sum(w * vector.get(term, 0) for term, w in query.items()) / (query_norm * norm)
+            if score >= best_score:
+                best, best_score = other, score
+        return best
+
+
+answer_cache = AnswerCache()
@@ -1,33 +1,35 @@
+import os
+import uuid
 import dash
-from dash import html, dcc, dash_table
+import diskcache
+from dash import html, dcc, dash_table, DiskcacheManager
 import dash_bootstrap_components as dbc
 from dash.dependencies import Input, Output, State
 import plotly.express as px
 import plotly.graph_objects as go
-import sqlite3
 from dash_iconify import DashIconify
-import requests
 from dash.exceptions import PreventUpdate
+from dash import Patch
+from database import create_database
+from cache import result_cache
+from catalogue import filter_catalogue
+from facets import facet_options
+from export import EXPORT_FORMATS, where_from_args, csv_stream, write_file, stream_file
+from flask import jsonify, request, Response, stream_with_context
+from datetime import datetime
+from chat_stream import chat_streams
 
 
+# Background jobs (CSV ingest) run in worker processes coordinated through diskcache
+background_cache = diskcache.Cache(os.getenv('BACKGROUND_CACHE_DIR', './.background-cache'))
+background_manager = DiskcacheManager(background_cache)
+
 dashapp = dash.Dash(__name__, 
-                external_stylesheets=[dbc.themes.BOOTSTRAP, '/assets/style.css'],  use_pages=True, suppress_callback_exceptions=True)
+                external_stylesheets=[dbc.themes.BOOTSTRAP, '/assets/style.css'],  use_pages=True, suppress_callback_exceptions=True,
+                background_callback_manager=background_manager)
 
 
 
-def create_database():
-    conn = sqlite3.connect('insurance_data.db')
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS insurance_transactions (
-        [Transaction Date] TEXT, [Policy No] TEXT, [Trans Type] TEXT, 
-        Branch TEXT, Class TEXT, [Dr/Cr No] TEXT, [Risk ID] TEXT,
-        Insured TEXT, [Intermediary Type] TEXT, Intermediary TEXT,
-        Marketer TEXT, WEF TEXT, WET TEXT, CURRENCY TEXT,
-        [Sum Insured] REAL, Premium REAL, PAID REAL,
-        Year INTEGER, [Month Name] TEXT, Month INTEGER,
-        Quarter INTEGER, Weeks INTEGER)''')
-    conn.commit()
-    conn.close()
 
 # Initialize the Dash app with dark theme and Bootstrap
 chat_interface = dbc.Collapse(
@@ -140,6 +142,8 @@ dbc.Row([
     
     dcc.Store(id='response-store', data=''),
     dcc.Store(id='user-input-store', data=''),
+    # Per browser tab, so the AI API keeps each conversation's history apart
+    dcc.Store(id='chat-session', storage_type='session'),
     dcc.Interval(id='stream-update', interval=100, disabled=True),
     
 ], fluid=True, className='app-container', id='main-container')
@@ -182,6 +186,57 @@ def update_theme(dark_mode):
     
     return container_class, table_header, table_cell, table_header, table_cell
 
+@dashapp.server.route('/api/cache-stats')
+def cache_stats():
+    """Hit/miss counters of the shared query result cache and the filter catalogue"""
+    return jsonify({**result_cache.stats(), 'filter_catalogue': filter_catalogue.stats()})
+
+@dashapp.server.route('/api/facets/<column>')
+def facets_endpoint(column):
+    """Values of a column that co-occur with the filters in the query string
+
+    /api/facets/Intermediary?Year=2025&Branch=ACCRA&Branch=TEMA&search=ab&limit=20
+    """
+    args = request.args
+    selections = {}
+    for key in args:
+        if key not in ('search', 'limit'):
+            values = args.getlist(key)
+            selections[key] = values if len(values) > 1 else values[0]
+    try:
+        limit = args.get('limit')
+        options = facet_options(column, selections, args.get('search'),
+                                int(limit) if limit else None)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify([{'value': value, 'count': count} for value, count in options])
+
+@dashapp.server.route('/export/transactions.<fmt>')
+def export_transactions(fmt):
+    """Data page extract for the filters in the query string
+
+    CSV is streamed straight from the cursor; XLSX and Parquet are written to a
+    temp file in chunks first.
+    """
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f"Unknown export format: {fmt}"}), 404
+
+    where = where_from_args(request.args)
+    filename = f"insurance_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+
+    if fmt in ('csv', 'csv.gz'):
+        return Response(stream_with_context(csv_stream(where, compress=fmt == 'csv.gz')),
+                        mimetype=EXPORT_FORMATS[fmt],
+                        headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+    try:
+        path = write_file(fmt, where)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return Response(stream_file(path), mimetype=EXPORT_FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"',
+                             'Content-Length': str(os.path.getsize(path))})
+
 # app.clientside_callback(
 #     """
 #     (switchOn) => {
@@ -206,14 +261,16 @@ def toggle_chat(n_clicks, is_open):
 @dash.callback(
     [Output("chat-messages", "children", allow_duplicate=True),
      Output("chat-input", "value"),
-     Output("user-input-store", "data")],
+     Output("user-input-store", "data"),
+     Output("chat-session", "data")],
     [Input("send-button", "n_clicks"),
      Input("chat-input", "n_submit")],
     [State("chat-input", "value"),
-     State("chat-messages", "children")],
+     State("chat-messages", "children"),
+     State("chat-session", "data")],
     prevent_initial_call=True
 )
-def send_message(n_clicks, n_submit, user_input, existing_messages):
+def send_message(n_clicks, n_submit, user_input, existing_messages, session_id):
     """Add user message and typing indicator"""
     if (not n_clicks and not n_submit) or not user_input:
         raise PreventUpdate
@@ -241,55 +298,66 @@ def send_message(n_clicks, n_submit, user_input, existing_messages):
     ], className="d-flex flex-row justify-content-start mb-4")
     
     new_messages = existing_messages + [user_message, typing_indicator]
-    return new_messages, "", user_input
+    return new_messages, "", user_input, session_id or uuid.uuid4().hex
+
+def assistant_message(text, error=False):
+    """Chat bubble for an assistant answer, red for errors"""
+    if error:
+        text, color = f"I'm sorry, I encountered an error: {text}", "bg-danger"
+    else:
+        color = "bg-secondary"
+    return html.Div([
+        html.Img(src="/assets/pic.png", className="chat-avatar"),
+        html.Div([
+            html.P(text, className=f"small p-2 ms-3 mb-1 rounded-3 {color} text-white")
+        ])
+    ], className="d-flex flex-row justify-content-start mb-4")
 
-# Update the response handler callback
+# Start streaming the answer; the typing indicator stays until the first chunk
 @dash.callback(
-    Output("chat-messages", "children", allow_duplicate=True),
+    [Output("response-store", "data"),
+     Output("stream-update", "disabled")],
     Input("user-input-store", "data"),
-    [State("chat-messages", "children")],
+    [State("chat-messages", "children"),
+     State("chat-session", "data")],
     prevent_initial_call=True
 )
-def get_assistant_response(user_input, existing_messages):
-    """Handle AI response and replace typing indicator"""
+def get_assistant_response(user_input, existing_messages, session_id):
+    """Ask the AI API and remember where its answer goes"""
     if not user_input or not existing_messages:
         raise PreventUpdate
     
-    try:
-        # Remove typing indicator (last element)
-        existing_messages = existing_messages[:-1]
-        
-        # Make API call
-        response = requests.post(
-            "http://localhost:8000/chat",
-            json={"message": user_input}
-        )
-        response.raise_for_status()
-        assistant_response = response.json().get("response", "No response found.")
-        # assistant_response = markdownify.markdownify(assistant_response)
-        
-        # Assistant message
-        assistant_message = html.Div([
-            html.Img(src="/assets/pic.png", className="chat-avatar"),
-            html.Div([
-                html.P(assistant_response,
-                      className="small p-2 ms-3 mb-1 rounded-3 bg-secondary text-white")
-            ])
-        ], className="d-flex flex-row justify-content-start mb-4")
-        
-        return existing_messages + [assistant_message]
+    stream_id = chat_streams.start(user_input, session_id)
+    # The typing indicator is the last message; the answer replaces it
+    return {"id": stream_id, "index": len(existing_messages) - 1}, False
+
+@dash.callback(
+    [Output("chat-messages", "children", allow_duplicate=True),
+     Output("stream-update", "disabled", allow_duplicate=True)],
+    Input("stream-update", "n_intervals"),
+    State("response-store", "data"),
+    prevent_initial_call=True
+)
+def update_streamed_response(n_intervals, stream):
+    """Show the part of the answer received so far"""
+    if not stream:
+        raise PreventUpdate
     
-    except Exception as e:
-        # Error message
-        error_message = html.Div([
-            html.Img(src="/assets/pic.png", className="chat-avatar"),
-            html.Div([
-                html.P(f"I'm sorry, I encountered an error: {str(e)}",
-                      className="small p-2 ms-3 mb-1 rounded-3 bg-danger text-white")
-            ])
-        ], className="d-flex flex-row justify-content-start mb-4")
-        
-        return existing_messages + [error_message]
+    state = chat_streams.read(stream["id"])
+    if state is None:
+        # Expired, or polled on a server process that did not start it
+        messages = Patch()
+        messages[stream["index"]] = assistant_message("the answer was lost, please ask again.", error=True)
+        return messages, True
+    if not state["changed"] or not (state["text"] or state["done"]):
+        raise PreventUpdate
+    
+    messages = Patch()
+    if state["error"]:
+        messages[stream["index"]] = assistant_message(state["error"], error=True)
+    else:
+        messages[stream["index"]] = assistant_message(state["text"] or "No response found.")
+    return messages, state["done"]
 
 
 
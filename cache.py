@@ -0,0 +1,121 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from database import read_sql, data_version
+
+
+# Entry and memory caps, override with RESULT_CACHE_ENTRIES / RESULT_CACHE_MB
+MAX_ENTRIES = int(os.getenv('RESULT_CACHE_ENTRIES', '512'))
+MAX_BYTES = int(float(os.getenv('RESULT_CACHE_MB', '128')) * 1024 * 1024)
+
+
+def normalize_filters(filters):
+    """Turn callback filter values into a hashable, order-independent key"""
+    if isinstance(filters, dict):
+        return tuple(sorted((k, normalize_filters(v)) for k, v in filters.items()))
+    if isinstance(filters, (list, tuple, set)):
+        values = [normalize_filters(v) for v in filters]
+        # Multi-select dropdowns: selection order does not change the result
+        if isinstance(filters, (list, set)):
+            values = sorted(values, key=repr)
+        return tuple(values) if values else None
+    if filters == '':
+        return None
+    return filters
+
+
+def _size_of(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_size_of(k) + _size_of(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_size_of(v) for v in value)
+    return sys.getsizeof(value)
+
+
+def _copy(value):
+    # Callbacks format DataFrames in place, so never hand out the cached object
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy()
+    if isinstance(value, dict):
+        return {k: _copy(v) for k, v in value.items()}
+    return value
+
+
+class ResultCache:
+    """LRU cache of query results keyed by (kind, filters, data version)
+
+    Every write to insurance_transactions bumps the data version, so entries
+    computed before an upload or delete are never served afterwards.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_compute(self, kind, filters, compute):
+        key = (kind, normalize_filters(filters), data_version())
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return _copy(self._entries[key][0])
+            self.misses += 1
+
+        value = compute()
+        size = _size_of(value)
+
+        with self._lock:
+            if size <= self.max_bytes and key not in self._entries:
+                self._entries[key] = (value, size)
+                self._bytes += size
+                self._evict()
+        return _copy(value)
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, (_, size) = self._entries.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'data_version': data_version(),
+            }
+
+
+result_cache = ResultCache()
+
+
+def cached_query(kind, filters, query, params=None):
+    """read_sql() through the shared result cache"""
+    return result_cache.get_or_compute(kind, filters, lambda: read_sql(query, params))
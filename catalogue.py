@@ -0,0 +1,73 @@
+import os
+import time
+import threading
+
+from database import read_connection, data_version
+
+
+# Seconds values() and months() trust the last data version check, so reading
+# several columns costs one round trip; override with CATALOGUE_CHECK_SECONDS
+CHECK_SECONDS = float(os.getenv('CATALOGUE_CHECK_SECONDS', '2'))
+
+# Text columns offered as filter dropdowns
+OPTION_COLUMNS = ['Trans Type', 'Branch', 'Class', 'Intermediary Type', 'Intermediary', 'Marketer', 'CURRENCY']
+
+# Every option is a cube dimension, and the cube is a fraction of the table's
+# size, so the options are re-read from it in full on every data change
+_OPTION_QUERIES = {
+    column: f'SELECT DISTINCT [{column}] FROM premium_cube WHERE [{column}] IS NOT NULL ORDER BY [{column}]'
+    for column in OPTION_COLUMNS + ['Year', 'Weeks']
+}
+_OPTION_QUERIES['Month'] = '''SELECT Month, MIN([Month Name]) FROM premium_cube
+    WHERE Month IS NOT NULL GROUP BY Month ORDER BY Month'''
+
+
+class FilterCatalogue:
+    """In-memory filter dropdown options, reloaded when the data version moves"""
+
+    def __init__(self, check_seconds=CHECK_SECONDS):
+        self.check_seconds = check_seconds
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked = None
+        self._options = {}
+        self.loads = 0
+
+    def refresh(self):
+        """Check the data version now; call once before reading every filter"""
+        with self._lock:
+            self._refresh(force=True)
+
+    def values(self, column):
+        """Sorted options for a text filter column, or 'Year' / 'Weeks'"""
+        with self._lock:
+            self._refresh()
+            return list(self._options[column])
+
+    def months(self):
+        """(Month, Month Name) pairs in calendar order"""
+        with self._lock:
+            self._refresh()
+            return list(self._options['Month'])
+
+    def stats(self):
+        with self._lock:
+            return {'data_version': self._version, 'loads': self.loads}
+
+    def _refresh(self, force=False):
+        now = time.monotonic()
+        if not force and self._checked is not None and now - self._checked < self.check_seconds:
+            return
+        self._checked = now
+        version = data_version()
+        if version == self._version:
+            return
+        with read_connection() as conn:
+            for column, query in _OPTION_QUERIES.items():
+                rows = conn.execute(query).fetchall()
+                self._options[column] = rows if column == 'Month' else [row[0] for row in rows]
+        self._version = version
+        self.loads += 1
+
+
+filter_catalogue = FilterCatalogue()
@@ -0,0 +1,103 @@
+import os
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+# SQLite file holding the chat history, override with CHAT_MEMORY_PATH
+CHAT_MEMORY_PATH = os.getenv('CHAT_MEMORY_PATH', 'chat_memory.db')
+
+# Question/answer pairs kept per session and replayed to the agent
+CHAT_HISTORY_TURNS = int(os.getenv('CHAT_HISTORY_TURNS', '3'))
+
+# Sessions kept in memory; the least recently used are reloaded from disk on demand
+CHAT_MAX_SESSIONS = int(os.getenv('CHAT_MAX_SESSIONS', '500'))
+
+# Days after which an idle session's history is deleted from disk
+CHAT_SESSION_TTL_DAYS = float(os.getenv('CHAT_SESSION_TTL_DAYS', '30'))
+
+_SCHEMA = '''CREATE TABLE IF NOT EXISTS chat_history (
+    id INTEGER PRIMARY KEY, session_id TEXT NOT NULL, asked REAL NOT NULL,
+    question TEXT NOT NULL, answer TEXT NOT NULL)'''
+_INDEX = 'CREATE INDEX IF NOT EXISTS idx_chat_history_session ON chat_history (session_id, id)'
+
+
+class ConversationMemory:
+    """Recent questions and answers per chat session
+
+    Each session keeps its last turns question/answer pairs, so one user's
+    conversation never reaches another user's prompt. Sessions live in an LRU
+    dict backed by SQLite, so a restart or eviction only costs a reload.
+    """
+
+    def __init__(self, path=CHAT_MEMORY_PATH, turns=CHAT_HISTORY_TURNS,
+                 max_sessions=CHAT_MAX_SESSIONS, ttl_days=CHAT_SESSION_TTL_DAYS):
+        self.turns = turns
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode = WAL')
+        with self._conn:
+            self._conn.execute(_SCHEMA)
+            self._conn.execute(_INDEX)
+            self._conn.execute('DELETE FROM chat_history WHERE asked < ?',
+                               (time.time() - ttl_days * 86400,))
+        self.loads = 0
+        self.evictions = 0
+
+    def history(self, session_id):
+        """The session's (question, answer) pairs, oldest first"""
+        if not session_id:
+            return []
+        with self._lock:
+            return list(self._session(session_id))
+
+    def messages(self, session_id):
+        """history() as chat messages to put before the new question"""
+        messages = []
+        for question, answer in self.history(session_id):
+            messages.append({'role': 'user', 'content': question})
+            messages.append({'role': 'assistant', 'content': answer})
+        return messages
+
+    def add(self, session_id, question, answer):
+        """Record a finished turn, dropping the session's oldest beyond turns"""
+        if not session_id or not answer:
+            return
+        with self._lock:
+            history = self._session(session_id)
+            history.append((question, answer))
+            # history[:-0] would keep everything, so zero turns is handled apart
+            history[:] = history[-self.turns:] if self.turns > 0 else []
+            with self._conn:
+                self._conn.execute(
+                    'INSERT INTO chat_history (session_id, asked, question, answer) VALUES (?, ?, ?, ?)',
+                    (session_id, time.time(), question, answer))
+                self._conn.execute('''DELETE FROM chat_history WHERE session_id = ? AND id NOT IN (
+                    SELECT id FROM chat_history WHERE session_id = ? ORDER BY id DESC LIMIT ?)''',
+                    (session_id, session_id, self.turns))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'sessions': len(self._sessions),
+                'max_sessions': self.max_sessions,
+                'loads': self.loads,
+                'evictions': self.evictions,
+            }
+
+    def _session(self, session_id):
+        history = self._sessions.get(session_id)
+        if history is None:
+            rows = self._conn.execute('''SELECT question, answer FROM chat_history
+                WHERE session_id = ? ORDER BY id DESC LIMIT ?''', (session_id, self.turns)).fetchall()
+            history = self._sessions[session_id] = rows[::-1]
+            self.loads += 1
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+        else:
+            self._sessions.move_to_end(session_id)
+        return history
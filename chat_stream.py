@@ -0,0 +1,108 @@
+import os
+import json
+import time
+import uuid
+import threading
+
+import requests
+
+
+# Base URL of the AI API (ai_api.py), override with CHAT_API_URL
+CHAT_API_URL = os.getenv('CHAT_API_URL', 'http://localhost:8000')
+
+# Seconds before a stream, read or not, is dropped from the buffer
+STREAM_MAX_AGE = int(os.getenv('CHAT_STREAM_MAX_AGE', '600'))
+
+
+def iter_events(lines):
+    """(event, data) pairs from the lines of a server-sent event stream"""
+    event, data = 'message', []
+    for line in lines:
+        if not line:
+            if data:
+                yield event, json.loads('\n'.join(data))
+            event, data = 'message', []
+        elif line.startswith('event:'):
+            event = line[6:].strip()
+        elif line.startswith('data:'):
+            data.append(line[5:].strip())
+
+
+class ChatStreams:
+    """Server-side buffer between /chat/stream and the chat panel
+
+    start() reads the answer on a background thread; the panel polls read()
+    on the stream-update interval and shows whatever has arrived so far.
+
+    The buffer lives in this process's memory, so the dashboard must run as a
+    single process (threads are fine). Under several workers a poll can reach
+    one that never started the stream; read() then returns None.
+    """
+
+    def __init__(self, api_url=CHAT_API_URL):
+        self.api_url = api_url
+        self._lock = threading.Lock()
+        self._streams = {}
+
+    def start(self, message, session_id=None):
+        """Ask the AI API and return the id to read the answer with"""
+        stream_id = uuid.uuid4().hex
+        with self._lock:
+            self._expire()
+            self._streams[stream_id] = {'text': '', 'done': False, 'error': None,
+                                        'seen': 0, 'delivered': False, 'started': time.monotonic()}
+        threading.Thread(target=self._fetch, args=(stream_id, message, session_id), daemon=True).start()
+        return stream_id
+
+    def read(self, stream_id):
+        """{'text', 'done', 'error', 'changed'} for a stream, None if unknown
+
+        Finished streams stay readable until they expire, so a poll already in
+        flight when the answer completes still finds it.
+        """
+        with self._lock:
+            stream = self._streams.get(stream_id)
+            if stream is None:
+                return None
+            changed = len(stream['text']) != stream['seen'] or stream['done']
+            changed = changed and not stream['delivered']
+            stream['seen'] = len(stream['text'])
+            stream['delivered'] = stream['done']
+            return {'text': stream['text'], 'done': stream['done'],
+                    'error': stream['error'], 'changed': changed}
+
+    def _fetch(self, stream_id, message, session_id):
+        try:
+            with requests.post(f"{self.api_url}/chat/stream",
+                               json={'message': message, 'session_id': session_id},
+                               stream=True, timeout=(5, None)) as response:
+                if response.status_code in (503, 504):
+                    # Busy or timed out: show the API's message rather than the HTTP error
+                    raise Exception(response.json().get('detail', response.reason))
+                response.raise_for_status()
+                for event, data in iter_events(response.iter_lines(decode_unicode=True)):
+                    if event == 'error':
+                        raise Exception(data)
+                    if event == 'done':
+                        break
+                    self._update(stream_id, text=data)
+            self._update(stream_id, done=True)
+        except Exception as e:
+            print(f"Error streaming chat response: {str(e)}")
+            self._update(stream_id, done=True, error=str(e))
+
+    def _update(self, stream_id, text='', done=False, error=None):
+        with self._lock:
+            stream = self._streams.get(stream_id)
+            if stream is not None:
+                stream['text'] += text
+                stream['done'] = done
+                stream['error'] = error
+
+    def _expire(self):
+        cutoff = time.monotonic() - STREAM_MAX_AGE
+        for stream_id in [key for key, stream in self._streams.items() if stream['started'] < cutoff]:
+            del self._streams[stream_id]
+
+
+chat_streams = ChatStreams()
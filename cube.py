@@ -0,0 +1,91 @@
+# Dimensions the premium cube is rolled up by. Names match insurance_transactions
+# so WHERE clauses built for the raw table run unchanged against the cube.
+CUBE_DIMENSIONS = [
+    'Year', 'Month', 'Month Name', 'Quarter', 'Weeks', 'Class', 'Branch',
+    'Trans Type', 'Intermediary Type', 'Intermediary', 'Marketer', 'CURRENCY'
+]
+
+_DIMS_SQL = ', '.join(f'[{col}]' for col in CUBE_DIMENSIONS)
+
+CUBE_SCHEMA = '''CREATE TABLE IF NOT EXISTS premium_cube (
+    Year INTEGER, Month INTEGER, [Month Name] TEXT, Quarter INTEGER, Weeks INTEGER,
+    Class TEXT, Branch TEXT, [Trans Type] TEXT, [Intermediary Type] TEXT,
+    Intermediary TEXT, Marketer TEXT, CURRENCY TEXT,
+    Premium REAL NOT NULL DEFAULT 0,
+    Transactions INTEGER NOT NULL DEFAULT 0)'''
+
+CUBE_INDEXES = {
+    # Cell lookup when applying deltas (IS comparisons can use it)
+    'idx_cube_cell': CUBE_DIMENSIONS,
+    'idx_cube_type_year': ['Intermediary Type', 'Year'],
+}
+
+_DELTA_SCHEMA = '''CREATE TEMP TABLE IF NOT EXISTS cube_delta (
+    Year INTEGER, Month INTEGER, [Month Name] TEXT, Quarter INTEGER, Weeks INTEGER,
+    Class TEXT, Branch TEXT, [Trans Type] TEXT, [Intermediary Type] TEXT,
+    Intermediary TEXT, Marketer TEXT, CURRENCY TEXT,
+    Premium REAL, Transactions INTEGER)'''
+
+_MATCH_CELL = ' AND '.join(f'c.[{col}] IS d.[{col}]' for col in CUBE_DIMENSIONS)
+
+
+def create_cube(conn):
+    """Create the premium_cube table and its indexes, filling it on first use"""
+    conn.execute(CUBE_SCHEMA)
+    for name, columns in CUBE_INDEXES.items():
+        cols = ', '.join(f'[{col}]' for col in columns)
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON premium_cube ({cols})")
+
+    # Existing databases: build the cube from the rows already loaded
+    cube_empty = conn.execute('SELECT 1 FROM premium_cube LIMIT 1').fetchone() is None
+    has_rows = conn.execute('SELECT 1 FROM insurance_transactions LIMIT 1').fetchone() is not None
+    if cube_empty and has_rows:
+        rebuild_cube(conn)
+
+
+def rebuild_cube(conn):
+    """Recompute the whole cube from insurance_transactions"""
+    conn.execute('DELETE FROM premium_cube')
+    conn.execute(f'''INSERT INTO premium_cube ({_DIMS_SQL}, Premium, Transactions)
+        SELECT {_DIMS_SQL}, TOTAL(Premium), COUNT(*)
+        FROM insurance_transactions
+        GROUP BY {_DIMS_SQL}''')
+
+
+def _apply_delta(conn):
+    """Merge temp.cube_delta into premium_cube and clear it"""
+    conn.execute(f'''UPDATE premium_cube AS c
+        SET Premium = c.Premium + d.Premium,
+            Transactions = c.Transactions + d.Transactions
+        FROM cube_delta AS d
+        WHERE {_MATCH_CELL}''')
+    conn.execute(f'''INSERT INTO premium_cube ({_DIMS_SQL}, Premium, Transactions)
+        SELECT {_DIMS_SQL}, Premium, Transactions
+        FROM cube_delta AS d
+        WHERE Transactions > 0
+          AND NOT EXISTS (SELECT 1 FROM premium_cube AS c WHERE {_MATCH_CELL})''')
+    conn.execute('DELETE FROM premium_cube WHERE Transactions <= 0')
+    conn.execute('DELETE FROM cube_delta')
+
+
+def _stage(conn, source, where_clause, params, sign):
+    conn.execute(_DELTA_SCHEMA)
+    conn.execute(f'''INSERT INTO cube_delta ({_DIMS_SQL}, Premium, Transactions)
+        SELECT {_DIMS_SQL}, {sign} * TOTAL(Premium), {sign} * COUNT(*)
+        FROM {source}
+        WHERE {where_clause}
+        GROUP BY {_DIMS_SQL}''', params or [])
+    _apply_delta(conn)
+
+
+def add_rows(conn, source, where_clause='1=1', params=None):
+    """Add rows about to be inserted (e.g. a staging table) to the cube"""
+    _stage(conn, source, where_clause, params, 1)
+
+
+def subtract_where(conn, where_clause, params=None):
+    """Remove the rows of insurance_transactions matching where_clause from the cube
+
+    Must run before the matching rows are deleted or overwritten, on the same connection.
+    """
+    _stage(conn, 'insurance_transactions', where_clause, params, -1)
@@ -0,0 +1,440 @@
+import os
+import queue
+import sqlite3
+import argparse
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+
+from cube import create_cube, rebuild_cube
+from dates import ensure_date_keys, store_iso_dates
+
+
+# Path of the SQLite database, override with INSURANCE_DB_PATH
+DB_PATH = os.getenv('INSURANCE_DB_PATH', 'insurance_data.db')
+
+# Read connections kept alive in the pool
+POOL_SIZE = int(os.getenv('INSURANCE_DB_POOL_SIZE', '8'))
+
+# Milliseconds a connection waits on a lock before raising "database is locked"
+BUSY_TIMEOUT_MS = int(os.getenv('INSURANCE_DB_BUSY_TIMEOUT', '5000'))
+
+# Prepared statements kept per connection. Filters are bound as parameters
+# (see filters.Where), so each query shape is only prepared once.
+STATEMENT_CACHE_SIZE = int(os.getenv('INSURANCE_DB_STATEMENT_CACHE', '256'))
+
+# Free pages returned to the file system per reclaim_space() transaction
+VACUUM_STEP_PAGES = int(os.getenv('INSURANCE_DB_VACUUM_STEP', '1000'))
+
+PRAGMAS = {
+    'synchronous': 'NORMAL',
+    'mmap_size': 268435456,     # 256 MB memory-mapped I/O
+    'cache_size': -65536,       # 64 MB page cache (negative value is KiB)
+    'temp_store': 'MEMORY',
+    'busy_timeout': BUSY_TIMEOUT_MS,
+}
+
+SCHEMA = '''CREATE TABLE IF NOT EXISTS insurance_transactions (
+    [Transaction Date] TEXT, [Policy No] TEXT, [Trans Type] TEXT,
+    Branch TEXT, Class TEXT, [Dr/Cr No] TEXT, [Risk ID] TEXT,
+    Insured TEXT, [Intermediary Type] TEXT, Intermediary TEXT,
+    Marketer TEXT, WEF TEXT, WET TEXT, CURRENCY TEXT,
+    [Sum Insured] REAL, Premium REAL, PAID REAL,
+    Year INTEGER, [Month Name] TEXT, Month INTEGER,
+    Quarter INTEGER, Weeks INTEGER, [Date Key] INTEGER)'''
+
+TRANSACTION_COLUMNS = [
+    'Transaction Date', 'Policy No', 'Trans Type', 'Branch', 'Class',
+    'Dr/Cr No', 'Risk ID', 'Insured', 'Intermediary Type', 'Intermediary',
+    'Marketer', 'WEF', 'WET', 'CURRENCY', 'Sum Insured', 'Premium', 'PAID',
+    'Year', 'Month Name', 'Month', 'Quarter', 'Weeks'
+]
+
+# Columns filled in on ingest rather than read from the upload
+DERIVED_COLUMNS = ['Date Key']
+STORED_COLUMNS = TRANSACTION_COLUMNS + DERIVED_COLUMNS
+
+# Natural key of a transaction line; re-uploading a row with the same key
+# updates it instead of adding a duplicate. Rows with a NULL key part never match.
+# The day comes from the parsed [Date Key], so 15/03/2025 from a CSV and
+# 2025-03-15 00:00:00 from a spreadsheet are the same transaction.
+NATURAL_KEY = ['Policy No', 'Dr/Cr No', 'Risk ID', 'Date Key']
+NATURAL_KEY_INDEX = 'ux_it_natural_date_key'
+# Earlier unique index on the raw [Transaction Date] text
+RETIRED_NATURAL_KEY_INDEX = 'ux_it_natural_key'
+
+# Tables from earlier releases: dropdown options now come from premium_cube and
+# date picker bounds from [Date Key]
+RETIRED_TABLES = [
+    'dim_trans_type', 'dim_branch', 'dim_class', 'dim_intermediary_type',
+    'dim_intermediary', 'dim_marketer', 'dim_currency', 'calendar',
+]
+
+# Small key/value table for bookkeeping such as the data version
+META_SCHEMA = '''CREATE TABLE IF NOT EXISTS app_meta (
+    key TEXT PRIMARY KEY, value INTEGER NOT NULL)'''
+
+# Managed index set for insurance_transactions.
+# Charts and cards aggregate from premium_cube, so the table only needs indexes
+# for the Data page filters and the remaining per-row lookups.
+INDEXES = {
+    # Year/Class filters with SUM(Premium) answered from the index alone
+    'idx_it_year_class_premium': ['Year', 'Class', 'Premium'],
+    # Single intermediary lookups (dashboard and data page filters)
+    'idx_it_intermediary_year': ['Intermediary', 'Year'],
+    'idx_it_branch': ['Branch'],
+    'idx_it_class': ['Class'],
+    # Insured options are counted on the table itself (not in the cube)
+    'idx_it_insured': ['Insured'],
+    # Date range predicates
+    'idx_it_date_key': ['[Date Key]'],
+}
+
+# Indexes from earlier releases that no query uses any more; dropped on sight
+RETIRED_INDEXES = [
+    'idx_it_year_branch_class_premium',
+    'idx_it_type_year_month_premium',
+    'idx_it_type_intermediary_year_premium',
+]
+
+
+def index_statements():
+    """CREATE INDEX statements for the managed index set"""
+    return {
+        name: f"CREATE INDEX IF NOT EXISTS {name} ON insurance_transactions ({', '.join(columns)})"
+        for name, columns in INDEXES.items()
+    }
+
+
+def existing_indexes(conn):
+    """Names of the indexes currently defined on insurance_transactions"""
+    rows = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'insurance_transactions'"
+    ).fetchall()
+    return {row[0] for row in rows}
+
+
+def drop_retired_indexes(conn):
+    """Drop any retired index that is still present and return the names dropped"""
+    present = existing_indexes(conn)
+    dropped = [name for name in RETIRED_INDEXES if name in present]
+    for name in dropped:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+    return dropped
+
+
+def ensure_indexes(conn):
+    """Create any managed index that is missing and return the names created
+
+    Retired indexes are dropped first so they stop costing writes and space.
+    """
+    drop_retired_indexes(conn)
+    present = existing_indexes(conn)
+    created = []
+    for name, statement in index_statements().items():
+        if name not in present:
+            conn.execute(statement)
+            created.append(name)
+    if created:
+        conn.execute('ANALYZE insurance_transactions')
+    return created
+
+
+def connect(readonly=False):
+    """Open a new connection to DB_PATH with the tuned pragmas applied"""
+    conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT_MS / 1000,
+                           check_same_thread=False, isolation_level=None,
+                           cached_statements=STATEMENT_CACHE_SIZE)
+    for pragma, value in PRAGMAS.items():
+        conn.execute(f"PRAGMA {pragma} = {value}")
+    if readonly:
+        conn.execute('PRAGMA query_only = ON')
+    return conn
+
+
+# Pooled read connections. A thread keeps the connection it checked out for the
+# duration of the outermost read_connection() block, so nested helpers share it.
+_read_pool = queue.LifoQueue(maxsize=POOL_SIZE)
+_local = threading.local()
+
+# Single writer connection, serialized by a lock
+_writer = None
+_writer_lock = threading.RLock()
+
+
+# Connections a forked child inherited; kept referenced so they are never closed there
+_inherited = []
+
+
+def _reset_after_fork():
+    """Give a forked process (background callbacks) its own connections and locks
+
+    SQLite connections must not be used across fork(), and a lock held by
+    another thread at fork time would never be released in the child.
+    """
+    global _writer, _writer_lock, _read_pool, _local
+    _inherited.append((_writer, _read_pool, getattr(_local, 'conn', None)))
+    _writer = None
+    _writer_lock = threading.RLock()
+    _read_pool = queue.LifoQueue(maxsize=POOL_SIZE)
+    _local = threading.local()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _get_writer():
+    """The writer connection, opened on first use; hold _writer_lock"""
+    global _writer
+    if _writer is None:
+        _writer = connect()
+        # Only takes effect on a new, empty database; see --vacuum for existing ones
+        _writer.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        _writer.execute('PRAGMA journal_mode = WAL')
+    return _writer
+
+
+@contextmanager
+def read_connection():
+    """Check out a read-only connection from the pool"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        _local.depth += 1
+        try:
+            yield conn
+        finally:
+            _local.depth -= 1
+        return
+
+    try:
+        conn = _read_pool.get_nowait()
+    except queue.Empty:
+        conn = connect(readonly=True)
+
+    _local.conn, _local.depth = conn, 0
+    try:
+        yield conn
+    finally:
+        _local.conn = None
+        try:
+            _read_pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+
+@contextmanager
+def write_connection():
+    """Hold the single writer connection inside one IMMEDIATE transaction"""
+    with _writer_lock:
+        writer = _get_writer()
+        if writer.in_transaction:
+            # Nested use joins the outer transaction
+            yield writer
+            return
+
+        writer.execute('BEGIN IMMEDIATE')
+        try:
+            yield writer
+        except BaseException:
+            writer.rollback()
+            raise
+        else:
+            writer.commit()
+
+
+def reclaim_space(step_pages=VACUUM_STEP_PAGES):
+    """Shrink the file by the free pages left after deletes, a step at a time
+
+    Each step is its own short transaction, so readers and writers get in
+    between. Needs auto_vacuum = INCREMENTAL; returns the pages freed. Call it
+    outside write_connection().
+    """
+    freed = 0
+    while True:
+        with _writer_lock:
+            writer = _get_writer()
+            if writer.in_transaction:
+                raise RuntimeError("reclaim_space() cannot run inside a write transaction")
+            if writer.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+                return freed
+            free = writer.execute('PRAGMA freelist_count').fetchone()[0]
+            if not free:
+                return freed
+            # executescript steps the pragma to completion; execute() frees a single page
+            writer.executescript(f'PRAGMA incremental_vacuum({int(step_pages)})')
+            freed += free - writer.execute('PRAGMA freelist_count').fetchone()[0]
+
+
+def enable_incremental_vacuum():
+    """Switch an existing database to auto_vacuum = INCREMENTAL (rewrites the file)"""
+    with _writer_lock:
+        writer = _get_writer()
+        writer.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        writer.execute('VACUUM')
+
+
+def read_sql(query, params=None):
+    """Run a SELECT on a pooled read connection and return a DataFrame"""
+    with read_connection() as conn:
+        return pd.read_sql_query(query, conn, params=params)
+
+
+def close_all():
+    """Close the writer and every idle pooled connection"""
+    global _writer
+    with _writer_lock:
+        if _writer is not None:
+            _writer.close()
+            _writer = None
+    while True:
+        try:
+            _read_pool.get_nowait().close()
+        except queue.Empty:
+            break
+
+
+def data_version():
+    """Counter bumped by every write to insurance_transactions"""
+    with read_connection() as conn:
+        try:
+            row = conn.execute("SELECT value FROM app_meta WHERE key = 'data_version'").fetchone()
+        except sqlite3.OperationalError:
+            # Database not created yet
+            return 0
+    return row[0] if row else 0
+
+
+def bump_data_version(conn):
+    """Invalidate cached results; call inside the write transaction"""
+    conn.execute('''INSERT INTO app_meta (key, value) VALUES ('data_version', 1)
+        ON CONFLICT(key) DO UPDATE SET value = value + 1''')
+
+
+def _key_sql(alias=''):
+    prefix = f'{alias}.' if alias else ''
+    return ', '.join(f'{prefix}[{col}]' for col in NATURAL_KEY)
+
+
+def count_duplicates(conn):
+    """Rows that share their natural key with a newer row"""
+    not_null = ' AND '.join(f'[{col}] IS NOT NULL' for col in NATURAL_KEY)
+    return int(conn.execute(f'''SELECT TOTAL(n - 1) FROM (
+        SELECT COUNT(*) AS n FROM insurance_transactions
+        WHERE {not_null} GROUP BY {_key_sql()} HAVING n > 1)''').fetchone()[0])
+
+
+def has_natural_key(conn):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (NATURAL_KEY_INDEX,)
+    ).fetchone() is not None
+
+
+def ensure_natural_key(conn):
+    """Create the unique natural-key index unless duplicates are still present"""
+    conn.execute(f"DROP INDEX IF EXISTS {RETIRED_NATURAL_KEY_INDEX}")
+    if has_natural_key(conn):
+        return True
+    duplicates = count_duplicates(conn)
+    if duplicates:
+        print(f"{duplicates} duplicate transaction(s) found; uploads append until "
+              f"'python database.py --dedupe' has been run.")
+        return False
+    conn.execute(f"CREATE UNIQUE INDEX {NATURAL_KEY_INDEX} ON insurance_transactions ({_key_sql()})")
+    return True
+
+
+def deduplicate(conn):
+    """Keep the newest row per natural key, rebuild the cube and add the unique index"""
+    not_null = ' AND '.join(f'[{col}] IS NOT NULL' for col in NATURAL_KEY)
+    removed = conn.execute(f'''DELETE FROM insurance_transactions
+        WHERE {not_null}
+          AND rowid NOT IN (SELECT MAX(rowid) FROM insurance_transactions
+                            WHERE {not_null} GROUP BY {_key_sql()})''').rowcount
+    if removed:
+        rebuild_cube(conn)
+        bump_data_version(conn)
+    ensure_natural_key(conn)
+    return removed
+
+
+def ensure_iso_dates(conn):
+    """Rewrite dates stored as uploaded by earlier releases as ISO text, once"""
+    if conn.execute("SELECT 1 FROM app_meta WHERE key = 'iso_dates'").fetchone():
+        return
+    if store_iso_dates(conn):
+        bump_data_version(conn)
+    conn.execute("INSERT INTO app_meta (key, value) VALUES ('iso_dates', 1)")
+
+
+def drop_retired_tables(conn):
+    for table in RETIRED_TABLES:
+        conn.execute(f"DROP TABLE IF EXISTS {table}")
+
+
+def create_database():
+    with write_connection() as conn:
+        conn.execute(META_SCHEMA)
+        conn.execute(SCHEMA)
+        ensure_date_keys(conn)
+        ensure_iso_dates(conn)
+        ensure_indexes(conn)
+        ensure_natural_key(conn)
+        create_cube(conn)
+        drop_retired_tables(conn)
+
+
+def check_indexes():
+    """Report the managed indexes on an existing database, create the missing ones and drop retired ones"""
+    with write_connection() as conn:
+        conn.execute(SCHEMA)
+        ensure_date_keys(conn)
+        present = existing_indexes(conn)
+        for name in INDEXES:
+            status = 'ok' if name in present else 'missing'
+            print(f"{name}: {status}")
+
+        dropped = drop_retired_indexes(conn)
+        created = ensure_indexes(conn)
+
+    if dropped:
+        print(f"Dropped {len(dropped)} retired index(es): {', '.join(dropped)}")
+    if created:
+        print(f"Created {len(created)} index(es): {', '.join(created)}")
+    else:
+        print("All managed indexes are present.")
+    return created
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Insurance database maintenance")
+    parser.add_argument('--check-indexes', action='store_true',
+                        help="check the managed indexes and create any that are missing")
+    parser.add_argument('--rebuild-cube', action='store_true',
+                        help="recompute the premium cube from insurance_transactions")
+    parser.add_argument('--dedupe', action='store_true',
+                        help="remove duplicate transactions and add the unique natural-key index")
+    parser.add_argument('--vacuum', action='store_true',
+                        help="compact the file and enable incremental vacuum after deletes")
+    args = parser.parse_args()
+
+    if args.check_indexes:
+        check_indexes()
+    elif args.rebuild_cube:
+        create_database()
+        with write_connection() as conn:
+            rebuild_cube(conn)
+        print("Premium cube rebuilt.")
+    elif args.dedupe:
+        create_database()
+        with write_connection() as conn:
+            removed = deduplicate(conn)
+        print(f"Removed {removed} duplicate transaction(s).")
+    elif args.vacuum:
+        create_database()
+        enable_incremental_vacuum()
+        print("Database compacted; deletes now return free space.")
+    else:
+        create_database()
+        print(f"Database ready at {DB_PATH}")
@@ -0,0 +1,107 @@
+import pandas as pd
+
+
+# Date columns stored as ISO 'YYYY-MM-DD' text, so they sort and compare as dates
+DATE_COLUMNS = ['Transaction Date', 'WEF', 'WET']
+
+# First and last transaction day as [Date Key]s, for date picker bounds.
+# MIN/MAX are read off idx_it_date_key.
+DATE_KEY_BOUNDS = 'SELECT MIN([Date Key]), MAX([Date Key]) FROM insurance_transactions'
+
+_ISO_GLOB = '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'
+
+_DATE_MAP_SCHEMA = 'CREATE TEMP TABLE IF NOT EXISTS date_map (text TEXT PRIMARY KEY, iso TEXT NOT NULL)'
+
+
+def parse_dates(values):
+    """Parse a column of dates, NaT where a value cannot be read
+
+    ISO dates are read as such; anything else is read day first, like the
+    dd/mm/yyyy dates in the upload template. Each distinct value is parsed once.
+    """
+    uniques = pd.Series(values.dropna().unique())
+    if uniques.empty:
+        return pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+    parsed = pd.to_datetime(uniques, format='ISO8601', errors='coerce')
+    rest = parsed.isna()
+    if rest.any():
+        parsed[rest] = pd.to_datetime(uniques[rest], dayfirst=True, format='mixed', errors='coerce')
+    lookup = pd.Series(parsed.values, index=uniques.values)
+    return pd.Series(lookup.reindex(values.values).values, index=values.index)
+
+
+def iso_dates(values):
+    """A column of dates as 'YYYY-MM-DD' text; values that cannot be read are kept as given"""
+    parsed = parse_dates(values)
+    return parsed.dt.strftime('%Y-%m-%d').where(parsed.notna(), values)
+
+
+def date_keys(dates):
+    """YYYYMMDD integer keys for a column of datetimes (<NA> for NaT)"""
+    return (dates.dt.year * 10000 + dates.dt.month * 100 + dates.dt.day).astype('Int64')
+
+
+def date_key(text):
+    """[Date Key] for an ISO date such as a date picker's '2025-03-31'"""
+    return int(pd.Timestamp(text).strftime('%Y%m%d'))
+
+
+def key_date(key):
+    """ISO date for a [Date Key], or None for a missing key"""
+    if pd.isna(key):
+        return None
+    return pd.Timestamp(str(int(key))).strftime('%Y-%m-%d')
+
+
+def date_range(where, start=None, end=None):
+    """Add inclusive [Date Key] bounds to a Where; either end may be left open"""
+    if start:
+        where.add('[Date Key] >= ?', date_key(start))
+    if end:
+        where.add('[Date Key] <= ?', date_key(end))
+    return where
+
+
+def ensure_date_keys(conn):
+    """Add [Date Key] to an existing insurance_transactions and fill it in
+
+    Returns the number of rows given a key.
+    """
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(insurance_transactions)')}
+    if 'Date Key' in columns:
+        return 0
+    conn.execute('ALTER TABLE insurance_transactions ADD COLUMN [Date Key] INTEGER')
+
+    texts = pd.Series([row[0] for row in conn.execute(
+        'SELECT DISTINCT [Transaction Date] FROM insurance_transactions WHERE [Transaction Date] IS NOT NULL')],
+        dtype=object)
+    keys = date_keys(parse_dates(texts))
+    known = keys.notna()
+    pairs = zip(keys[known].astype('int64').tolist(), texts[known].tolist())
+    return conn.executemany(
+        'UPDATE insurance_transactions SET [Date Key] = ? WHERE [Transaction Date] = ?', pairs).rowcount
+
+
+def store_iso_dates(conn):
+    """Rewrite stored DATE_COLUMNS values that are not ISO dates yet
+
+    Each column is rewritten in one pass through a temp table of distinct
+    values. Returns the number of rows changed.
+    """
+    conn.execute(_DATE_MAP_SCHEMA)
+    updated = 0
+    for col in DATE_COLUMNS:
+        texts = pd.Series([row[0] for row in conn.execute(
+            f'''SELECT DISTINCT [{col}] FROM insurance_transactions
+                WHERE [{col}] IS NOT NULL AND [{col}] NOT GLOB ?''', (_ISO_GLOB,))], dtype=object)
+        if texts.empty:
+            continue
+        isos = iso_dates(texts)
+        changed = isos != texts
+        conn.execute('DELETE FROM temp.date_map')
+        conn.executemany('INSERT INTO temp.date_map (text, iso) VALUES (?, ?)',
+                         zip(texts[changed].tolist(), isos[changed].tolist()))
+        updated += conn.execute(f'''UPDATE insurance_transactions
+            SET [{col}] = (SELECT iso FROM temp.date_map WHERE text = [{col}])
+            WHERE [{col}] IN (SELECT text FROM temp.date_map)''').rowcount
+    return updated
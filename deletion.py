@@ -0,0 +1,53 @@
+import os
+
+import cube
+from database import read_connection, write_connection, bump_data_version, reclaim_space
+
+
+# Rows removed per write transaction, override with DELETE_BATCH_SIZE
+DELETE_BATCH_SIZE = int(os.getenv('DELETE_BATCH_SIZE', '5000'))
+
+_BATCH_SCHEMA = 'CREATE TEMP TABLE IF NOT EXISTS delete_batch (id INTEGER PRIMARY KEY)'
+_IN_BATCH = 'rowid IN (SELECT id FROM temp.delete_batch)'
+
+
+def count_matching(where):
+    """Number of transactions a delete with this Where would remove"""
+    with read_connection() as conn:
+        return conn.execute(
+            f"SELECT COUNT(*) FROM insurance_transactions WHERE {where.sql}", where.params
+        ).fetchone()[0]
+
+
+def delete_where(where, batch_size=DELETE_BATCH_SIZE, vacuum=False):
+    """Delete the transactions matching where, batch_size rows per transaction
+
+    The write lock is released between batches so dashboard readers are not
+    blocked for the whole delete. Each batch takes its rows out of the premium
+    cube and bumps the data version, so readers always see a consistent state.
+    Returns the rows deleted, the batches run and the pages freed by vacuum.
+    """
+    deleted = batches = 0
+    last_rowid = 0
+    while True:
+        with write_connection() as conn:
+            conn.execute(_BATCH_SCHEMA)
+            conn.execute('DELETE FROM temp.delete_batch')
+            conn.execute(f"""INSERT INTO temp.delete_batch (id)
+                SELECT rowid FROM insurance_transactions
+                WHERE ({where.sql}) AND rowid > ?
+                ORDER BY rowid
+                LIMIT ?""", where.params + [last_rowid, int(batch_size)])
+            last_rowid, rows = conn.execute('SELECT MAX(id), COUNT(*) FROM temp.delete_batch').fetchone()
+            if not rows:
+                if deleted:
+                    bump_data_version(conn)
+                break
+            cube.subtract_where(conn, _IN_BATCH)
+            conn.execute(f'DELETE FROM insurance_transactions WHERE {_IN_BATCH}')
+            bump_data_version(conn)
+        deleted += rows
+        batches += 1
+
+    freed = reclaim_space() if vacuum and deleted else 0
+    return {'deleted': deleted, 'batches': batches, 'freed_pages': freed}
@@ -0,0 +1,157 @@
+import io
+import os
+import csv
+import zlib
+import tempfile
+import importlib.util
+from urllib.parse import urlencode
+
+import pandas as pd
+
+from database import read_connection, TRANSACTION_COLUMNS
+from filters import Where
+from dates import date_range
+from ingest import NUMERIC_COLUMNS, INTEGER_COLUMNS
+
+
+# Rows fetched from the cursor per step, override with EXPORT_CHUNK_ROWS
+CHUNK_ROWS = int(os.getenv('EXPORT_CHUNK_ROWS', '50000'))
+
+EXPORT_FORMATS = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv',
+    'csv.gz': 'application/gzip',
+}
+# Parquet is only offered when the optional pyarrow package is installed
+if importlib.util.find_spec('pyarrow') is not None:
+    EXPORT_FORMATS['parquet'] = 'application/vnd.apache.parquet'
+
+# Query string parameter -> column, as used by the Data page filters
+EXPORT_FILTERS = {
+    'year': 'Year',
+    'month': 'Month',
+    'week': 'Weeks',
+    'type': 'Intermediary Type',
+    'intermediary': 'Intermediary',
+    'class': 'Class',
+}
+
+_COLUMNS_SQL = ', '.join(f'[{col}]' for col in TRANSACTION_COLUMNS)
+
+
+def export_url(fmt, years, months, weeks, i_types, intermediaries, classes, start_date=None, end_date=None):
+    """Link to /export for the Data page filter values"""
+    selections = zip(EXPORT_FILTERS, [years, months, weeks, i_types, intermediaries, classes])
+    params = [(key, value) for key, values in selections for value in values or []]
+    params += [(key, value) for key, value in [('from', start_date), ('to', end_date)] if value]
+    query = urlencode(params)
+    return f"/export/transactions.{fmt}" + (f"?{query}" if query else '')
+
+
+def where_from_args(args):
+    """Where for a request's query string (a werkzeug MultiDict)"""
+    where = Where()
+    for key, column in EXPORT_FILTERS.items():
+        where.isin(column, args.getlist(key))
+    return date_range(where, args.get('from'), args.get('to'))
+
+
+def iter_rows(where, chunk_rows=CHUNK_ROWS):
+    """Yield the matching transactions in lists of at most chunk_rows tuples"""
+    with read_connection() as conn:
+        cursor = conn.execute(
+            f"SELECT {_COLUMNS_SQL} FROM insurance_transactions WHERE {where.sql} ORDER BY rowid", where.params
+        )
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            yield rows
+
+
+def csv_stream(where, compress=False):
+    """Yield the export as CSV bytes chunk by chunk, gzip-compressed if asked"""
+    compressor = zlib.compressobj(wbits=31) if compress else None
+
+    def encode(rows):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        data = buffer.getvalue().encode('utf-8')
+        return compressor.compress(data) if compressor else data
+
+    yield encode([TRANSACTION_COLUMNS])
+    for rows in iter_rows(where):
+        yield encode(rows)
+    if compressor:
+        yield compressor.flush()
+
+
+def write_xlsx(where, path):
+    """Write the export to an XLSX file, one row at a time in constant memory"""
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+    worksheet = workbook.add_worksheet('Insurance Data')
+
+    header_format = workbook.add_format({
+        'bold': True,
+        'text_wrap': True,
+        'valign': 'top',
+        'bg_color': '#D3D3D3',
+        'border': 1
+    })
+    # constant_memory writes rows in order, so the header and widths go first
+    worksheet.set_column(0, len(TRANSACTION_COLUMNS) - 1, 15)
+    worksheet.write_row(0, 0, TRANSACTION_COLUMNS, header_format)
+
+    row_num = 1
+    for rows in iter_rows(where):
+        for row in rows:
+            worksheet.write_row(row_num, 0, row)
+            row_num += 1
+    workbook.close()
+
+
+def write_parquet(where, path):
+    """Write the export to a Parquet file, one row group per chunk"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError("Parquet export needs the pyarrow package")
+
+    # Fixed schema so chunks where a column is all NULL still line up
+    schema = pa.schema([
+        (col, pa.float64() if col in NUMERIC_COLUMNS else pa.int64() if col in INTEGER_COLUMNS else pa.string())
+        for col in TRANSACTION_COLUMNS
+    ])
+    with pq.ParquetWriter(path, schema) as writer:
+        for rows in iter_rows(where):
+            df = pd.DataFrame.from_records(rows, columns=TRANSACTION_COLUMNS)
+            writer.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False))
+
+
+def write_file(fmt, where):
+    """Write an xlsx or parquet export to a temp file and return its path"""
+    writer = {'xlsx': write_xlsx, 'parquet': write_parquet}[fmt]
+    fd, path = tempfile.mkstemp(suffix=f'.{fmt}')
+    os.close(fd)
+    try:
+        writer(where, path)
+    except Exception:
+        os.remove(path)
+        raise
+    return path
+
+
+def stream_file(path, chunk_bytes=1024 * 1024):
+    """Yield a temp file's bytes and delete it once sent (or abandoned)"""
+    try:
+        with open(path, 'rb') as f:
+            while True:
+                data = f.read(chunk_bytes)
+                if not data:
+                    break
+                yield data
+    finally:
+        os.remove(path)
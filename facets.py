@@ -0,0 +1,79 @@
+import os
+
+from cache import cached_query
+from cube import CUBE_DIMENSIONS
+from filters import Where
+
+
+# Options returned per request for HIGH_CARDINALITY columns, override with FACET_LIMIT
+FACET_LIMIT = int(os.getenv('FACET_LIMIT', '50'))
+
+# Too many values to send whole; these return the top FACET_LIMIT and are searched
+# on the server. Other columns return every value unless a limit is given.
+HIGH_CARDINALITY = ['Intermediary', 'Marketer', 'Insured']
+
+# Columns not in the cube are counted on insurance_transactions
+FACET_COLUMNS = CUBE_DIMENSIONS + ['Insured']
+
+
+def selection_where(selections, exclude=None):
+    """WHERE clause for the other filters' selections
+
+    A facet ignores its own selection so every value stays reachable.
+    """
+    where = Where()
+    for column, value in (selections or {}).items():
+        if column == exclude or column not in FACET_COLUMNS:
+            continue
+        if isinstance(value, (list, tuple)):
+            where.isin(column, value)
+        else:
+            where.equals(column, value)
+    return where
+
+
+def facet_options(column, selections=None, search=None, limit=None):
+    """Values of column that co-occur with selections, with transaction counts
+
+    Returns up to limit [value, count] pairs, most frequent first; limit defaults
+    to FACET_LIMIT for HIGH_CARDINALITY columns and to all values otherwise.
+    search keeps values containing it (case-insensitive). Reads the premium cube
+    unless a column outside it is involved.
+    """
+    if column not in FACET_COLUMNS:
+        raise ValueError(f"Unknown facet column: {column}")
+    if limit is None:
+        # SQLite treats a negative LIMIT as no limit
+        limit = FACET_LIMIT if column in HIGH_CARDINALITY else -1
+
+    where = selection_where(selections, exclude=column)
+    where.add(f"[{column}] IS NOT NULL")
+    if search:
+        where.add(f"instr(upper([{column}]), upper(?)) > 0", search)
+
+    in_cube = column in CUBE_DIMENSIONS and all(
+        col in CUBE_DIMENSIONS for col in (selections or {}) if col in FACET_COLUMNS
+    )
+    source, count = ('premium_cube', 'SUM(Transactions)') if in_cube else ('insurance_transactions', 'COUNT(*)')
+
+    query = f"""
+    SELECT [{column}] as value, {count} as count
+    FROM {source}
+    WHERE {where.sql}
+    GROUP BY [{column}]
+    ORDER BY count DESC, value
+    LIMIT ?
+    """
+    df = cached_query('facet', (column, selections, search, limit), query, where.params + [int(limit)])
+    return [[row.value, int(row.count)] for row in df.itertuples(index=False)]
+
+
+def dropdown_options(column, selections=None, search=None, selected=None, limit=None):
+    """facet_options() as dcc.Dropdown options, keeping the selected value(s) listed"""
+    options = [{'label': f"{value} ({count:,})", 'value': value}
+               for value, count in facet_options(column, selections, search, limit)]
+    listed = {option['value'] for option in options}
+    for value in selected if isinstance(selected, (list, tuple)) else [selected]:
+        if value not in (None, '') and value not in listed:
+            options.insert(0, {'label': str(value), 'value': value})
+    return options
@@ -0,0 +1,61 @@
+class Where:
+    """Build a WHERE clause with bound parameters
+
+    Values never end up in the SQL text, so the same combination of filters
+    always produces the same statement and SQLite can reuse the prepared
+    statement from the connection's cache. IN lists are padded to a power of
+    two so multi-selects only produce a handful of statement shapes.
+
+        where = Where().equals('Class', class_).isin('Branch', branches)
+        read_sql(f"SELECT ... WHERE {where.sql}", where.params)
+    """
+
+    def __init__(self):
+        self.conditions = []
+        self.params = []
+
+    def add(self, condition, *params):
+        """Add a raw condition whose placeholders are bound to params"""
+        self.conditions.append(condition)
+        self.params.extend(params)
+        return self
+
+    def equals(self, column, value):
+        """column = value, skipped when no value is selected"""
+        if value is None or value == '':
+            return self
+        return self.add(f"[{column}] = ?", value)
+
+    def isin(self, column, values):
+        """column IN (...), skipped when nothing is selected"""
+        if not values or not any(values):
+            return self
+        values = list(values)
+        return self.add(f"[{column}] IN ({', '.join('?' * bucket_size(len(values)))})",
+                        *pad(values))
+
+    def extend(self, conditions, params):
+        """Add conditions built elsewhere, e.g. from a DataTable filter_query"""
+        self.conditions.extend(conditions)
+        self.params.extend(params)
+        return self
+
+    @property
+    def sql(self):
+        return " AND ".join(self.conditions) if self.conditions else "1=1"
+
+    def __bool__(self):
+        return bool(self.conditions)
+
+
+def bucket_size(n):
+    """Smallest power of two >= n"""
+    size = 1
+    while size < n:
+        size *= 2
+    return size
+
+
+def pad(values):
+    # Repeating a value inside IN (...) does not change the result
+    return values + [values[-1]] * (bucket_size(len(values)) - len(values))
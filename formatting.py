@@ -0,0 +1,25 @@
+from dash.dash_table.Format import Format, Group, Scheme, Symbol
+
+
+# Formats applied by DataTable in the browser, so callbacks send plain numbers
+MONEY = Format(precision=2, scheme=Scheme.fixed, group=Group.yes)
+PERCENT = Format(precision=2, scheme=Scheme.fixed, group=Group.yes,
+                 symbol=Symbol.yes, symbol_suffix='%', nully='N/A')
+
+
+def table_columns(df, money=(), percent=()):
+    """DataTable column specs for df, numeric columns carry their display format"""
+    columns = []
+    for col in df.columns:
+        spec = {"name": col, "id": col}
+        if col in money:
+            spec.update(type='numeric', format=MONEY)
+        elif col in percent:
+            spec.update(type='numeric', format=PERCENT)
+        columns.append(spec)
+    return columns
+
+
+def table_records(df):
+    """df.to_dict('records') with NaN sent as null so nully formats apply"""
+    return df.astype(object).where(df.notna(), None).to_dict('records')
@@ -0,0 +1,211 @@
+import os
+import base64
+import tempfile
+
+import chardet
+import pandas as pd
+
+import cube
+from dates import DATE_COLUMNS, parse_dates, iso_dates, date_keys
+from database import (write_connection, bump_data_version, has_natural_key,
+                      TRANSACTION_COLUMNS, STORED_COLUMNS, NATURAL_KEY)
+
+
+# Rows parsed, validated and inserted per step, override with INGEST_CHUNK_SIZE
+CHUNK_SIZE = int(os.getenv('INGEST_CHUNK_SIZE', '50000'))
+
+# Bytes inspected to guess the file encoding
+ENCODING_SAMPLE_BYTES = 256 * 1024
+
+# Base64 characters decoded per slice (multiple of 4)
+DECODE_SLICE_CHARS = 4 * 1024 * 1024
+
+UPPERCASE_COLUMNS = ['Branch', 'Class', 'Insured', 'Intermediary Type', 'Intermediary', 'Marketer']
+NUMERIC_COLUMNS = ['Sum Insured', 'Premium', 'PAID']
+INTEGER_COLUMNS = ['Year', 'Month', 'Quarter', 'Weeks']
+TEXT_COLUMNS = [col for col in TRANSACTION_COLUMNS if col not in NUMERIC_COLUMNS + INTEGER_COLUMNS]
+
+# Text columns are read as written; inferred per chunk, a numeric-looking key
+# would come back as 11 from one file and 11.0 from another with a blank
+READ_DTYPES = dict.fromkeys(TEXT_COLUMNS, str)
+
+_COLUMNS_SQL = ', '.join(f'[{col}]' for col in STORED_COLUMNS)
+_KEY_SQL = ', '.join(f'[{col}]' for col in NATURAL_KEY)
+_KEY_NOT_NULL = ' AND '.join(f'[{col}] IS NOT NULL' for col in NATURAL_KEY)
+
+# Each chunk is loaded into a temp staging table and merged from there
+_STAGING_SCHEMA = 'CREATE TEMP TABLE staging_transactions AS SELECT * FROM insurance_transactions WHERE 0'
+
+_STAGE_SQL = "INSERT INTO staging_transactions ({}) VALUES ({})".format(
+    _COLUMNS_SQL, ', '.join('?' * len(STORED_COLUMNS))
+)
+
+# A key repeated inside one chunk keeps its last row, like a sequential upsert would
+_DEDUPE_STAGING_SQL = f'''DELETE FROM staging_transactions
+    WHERE {_KEY_NOT_NULL}
+      AND rowid NOT IN (SELECT MAX(rowid) FROM staging_transactions WHERE {_KEY_NOT_NULL} GROUP BY {_KEY_SQL})'''
+
+_EXISTING_ROWS = 'rowid IN (SELECT t.rowid FROM insurance_transactions AS t JOIN staging_transactions AS s ON {})'.format(
+    ' AND '.join(f't.[{col}] = s.[{col}]' for col in NATURAL_KEY)
+)
+
+_UPSERT_SQL = f'''INSERT INTO insurance_transactions ({_COLUMNS_SQL})
+    SELECT {_COLUMNS_SQL} FROM staging_transactions WHERE true
+    ON CONFLICT ({_KEY_SQL}) DO UPDATE SET
+    {', '.join(f'[{col}] = excluded.[{col}]' for col in STORED_COLUMNS if col not in NATURAL_KEY)}'''
+
+_APPEND_SQL = f'''INSERT INTO insurance_transactions ({_COLUMNS_SQL})
+    SELECT {_COLUMNS_SQL} FROM staging_transactions'''
+
+
+def decode_upload(contents, path):
+    """Decode a dcc.Upload data URL into a file slice by slice
+
+    Returns the content type from the data URL header.
+    """
+    content_type, content_string = contents.split(',', 1)
+    with open(path, 'wb') as out:
+        for start in range(0, len(content_string), DECODE_SLICE_CHARS):
+            out.write(base64.b64decode(content_string[start:start + DECODE_SLICE_CHARS]))
+    return content_type
+
+
+def detect_encoding(path):
+    """Guess the encoding of a text file from a bounded sample"""
+    with open(path, 'rb') as f:
+        sample = f.read(ENCODING_SAMPLE_BYTES)
+    return chardet.detect(sample)['encoding'] or 'utf-8'
+
+
+def missing_columns(df):
+    return [col for col in TRANSACTION_COLUMNS if col not in df.columns]
+
+
+def key_text(values):
+    """Natural-key values as text, whole floats without the trailing .0"""
+    def text(value):
+        if isinstance(value, float) and value.is_integer():
+            return str(int(value))
+        return str(value)
+    return values.where(values.isna(), values.map(text))
+
+
+def normalize_chunk(df):
+    """Validate and normalize one chunk of transactions
+
+    Returns the clean rows and the number of rejected rows. Rows whose
+    Premium or Year cannot be read as numbers are rejected.
+    """
+    missing = missing_columns(df)
+    if missing:
+        raise ValueError(f"Missing columns in DataFrame: {missing}")
+
+    df = df[TRANSACTION_COLUMNS].copy()
+
+    # Frames not read with READ_DTYPES may still carry inferred numbers
+    for col in NATURAL_KEY:
+        if col in TEXT_COLUMNS:
+            df[col] = key_text(df[col])
+
+    # Convert specific columns to uppercase
+    for col in UPPERCASE_COLUMNS:
+        values = df[col]
+        df[col] = values.where(values.isna(), values.astype(str).str.strip().str.upper())
+
+    for col in NUMERIC_COLUMNS:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    for col in INTEGER_COLUMNS:
+        df[col] = pd.to_numeric(df[col], errors='coerce').astype('Int64')
+
+    # Dates as ISO text whatever the file's format, plus an integer day key
+    # for range filters and the natural key
+    for col in DATE_COLUMNS:
+        df[col] = iso_dates(df[col])
+    df['Date Key'] = date_keys(parse_dates(df['Transaction Date']))
+
+    valid = df['Premium'].notna() & df['Year'].notna()
+    return df[valid], int((~valid).sum())
+
+
+def insert_chunk(conn, df, upsert=True):
+    """Merge a normalized chunk into insurance_transactions and the premium cube
+
+    With upsert, rows whose natural key already exists replace the stored row
+    instead of being appended. Returns (rows written, existing rows replaced).
+    """
+    conn.execute('DROP TABLE IF EXISTS temp.staging_transactions')
+    conn.execute(_STAGING_SCHEMA)
+    rows = df.astype(object).where(df.notna(), None)
+    conn.executemany(_STAGE_SQL, rows.itertuples(index=False, name=None))
+
+    replaced = 0
+    if upsert:
+        conn.execute(_DEDUPE_STAGING_SQL)
+        # Rows being replaced leave the cube before their new values are added
+        replaced = conn.execute(f"SELECT COUNT(*) FROM insurance_transactions WHERE {_EXISTING_ROWS}").fetchone()[0]
+        if replaced:
+            cube.subtract_where(conn, _EXISTING_ROWS)
+
+    written = conn.execute('SELECT COUNT(*) FROM staging_transactions').fetchone()[0]
+    cube.add_rows(conn, 'staging_transactions')
+    conn.execute(_UPSERT_SQL if upsert else _APPEND_SQL)
+    return written, replaced
+
+
+def ingest_chunks(chunks, progress=None, position=None):
+    """Normalize and insert an iterable of DataFrames inside one transaction
+
+    progress, if given, is called with the running stats after every chunk.
+    position, if given, maps the stats to the fraction of the input consumed.
+    """
+    stats = {'rows': 0, 'inserted': 0, 'updated': 0, 'rejected': 0, 'fraction': 0.0, 'committed': False}
+    with write_connection() as conn:
+        # Databases that still hold duplicates have no unique key to upsert on
+        upsert = has_natural_key(conn)
+        for chunk in chunks:
+            clean, rejected = normalize_chunk(chunk)
+            written, replaced = insert_chunk(conn, clean, upsert)
+            stats['rows'] += len(chunk)
+            stats['inserted'] += written - replaced
+            stats['updated'] += replaced
+            stats['rejected'] += rejected
+            if position:
+                stats['fraction'] = position(stats)
+            if progress:
+                progress(dict(stats))
+        bump_data_version(conn)
+    stats['fraction'] = 1.0
+    stats['committed'] = True
+    return stats
+
+
+def ingest_frame(df, progress=None):
+    """Insert an in-memory DataFrame in CHUNK_SIZE slices"""
+    total = max(len(df), 1)
+    chunks = (df.iloc[start:start + CHUNK_SIZE] for start in range(0, len(df), CHUNK_SIZE))
+    return ingest_chunks(chunks, progress, position=lambda stats: stats['rows'] / total)
+
+
+def ingest_csv(path, encoding=None, progress=None):
+    """Stream a CSV file into the database without loading it whole"""
+    encoding = encoding or detect_encoding(path)
+    size = max(os.path.getsize(path), 1)
+    with open(path, 'rb') as f:
+        reader = pd.read_csv(f, encoding=encoding, chunksize=CHUNK_SIZE, dtype=READ_DTYPES)
+        return ingest_chunks(reader, progress, position=lambda stats: min(f.tell() / size, 1.0))
+
+
+def ingest_upload(contents, filename=None, progress=None):
+    """Ingest a dcc.Upload payload (CSV or Excel)"""
+    fd, path = tempfile.mkstemp(suffix='.upload')
+    os.close(fd)
+    try:
+        content_type = decode_upload(contents, path)
+        is_excel = (filename or '').lower().endswith(('.xlsx', '.xls')) \
+            or 'xlsx' in content_type or 'spreadsheetml' in content_type
+        if is_excel:
+            # Excel workbooks cannot be read in chunks; insert in slices instead
+            return ingest_frame(pd.read_excel(path, dtype=READ_DTYPES), progress)
+        return ingest_csv(path, progress=progress)
+    finally:
+        os.remove(path)
@@ -0,0 +1,182 @@
+"""Shared analytics behind the Agents, Brokers, Direct and Reinsurance pages.
+
+All four pages are served from one grouped pass over the premium cube that
+covers every intermediary type, so visiting them all costs a single scan.
+"""
+import dash
+from dash import Input, Output, State
+from datetime import datetime
+
+from cache import cached_query
+from filters import Where
+from formatting import table_columns, table_records
+from facets import dropdown_options
+from aggregations import summarize
+
+
+BASE_DIMENSIONS = ['Intermediary Type', 'Intermediary', 'Year', 'Month', 'Month Name', 'Quarter', 'Trans Type']
+
+
+def intermediary_base():
+    """SUM(Premium) for every intermediary type, cached until the data changes"""
+    dimensions = ', '.join(f'[{col}]' for col in BASE_DIMENSIONS)
+    query = f"""
+    SELECT {dimensions}, SUM(Premium) as Premium, SUM(Transactions) as Transactions
+    FROM premium_cube
+    GROUP BY {dimensions}
+    """
+    return cached_query('intermediary_base', None, query)
+
+
+def _select(df, intermediary_type, year=None, month=None, quarter=None, intermediary=None):
+    mask = df['Intermediary Type'] == intermediary_type
+    if year: mask &= df['Year'] == int(year)
+    if month: mask &= df['Month'] == int(month)
+    if quarter: mask &= df['Quarter'] == int(quarter)
+    if intermediary: mask &= df['Intermediary'] == intermediary
+    return df[mask]
+
+
+def intermediary_summary(intermediary_type, year=None, month=None, quarter=None, intermediary=None):
+    """Summary card figures, see aggregations.premium_summary()"""
+    return summarize(_select(intermediary_base(), intermediary_type, year, month, quarter, intermediary))
+
+
+def year_comparison(intermediary_type, keys, intermediary=None, current_year=None):
+    """Previous vs current year premium per key with the percentage difference"""
+    current_year = current_year or datetime.now().year
+    previous_year = current_year - 1
+
+    df = _select(intermediary_base(), intermediary_type, intermediary=intermediary)
+    premium = df['Premium'].fillna(0)
+    frame = df[keys].assign(**{
+        str(previous_year): premium.where(df['Year'] == previous_year, 0),
+        str(current_year): premium.where(df['Year'] == current_year, 0),
+    })
+    result = frame.groupby(keys, sort=True, as_index=False).sum()
+
+    previous = result[str(previous_year)].replace(0, float('nan'))
+    result['Difference'] = (result[str(current_year)] - previous) / previous * 100
+    return result
+
+
+def monthly_comparison(intermediary_type, intermediary=None, current_year=None):
+    # Grouping by the integer Month keeps the months in calendar order
+    result = year_comparison(intermediary_type, ['Month', 'Month Name'], intermediary, current_year)
+    return result.drop(columns='Month').rename(columns={'Month Name': 'Month'})
+
+
+def quarterly_comparison(intermediary_type, intermediary=None, current_year=None):
+    result = year_comparison(intermediary_type, ['Quarter'], intermediary, current_year)
+    result['Quarter'] = 'Q' + result['Quarter'].astype(int).astype(str)
+    return result
+
+
+def rankings(intermediary_type, year=None, month=None, quarter=None, label='Intermediary'):
+    """Premium and distinct policy count per intermediary, ranked by premium
+
+    Distinct policy counts cannot be rolled up, so this reads the raw table;
+    one query per period still covers every intermediary type.
+    """
+    where = Where().equals('Year', year).equals('Month', month).equals('Quarter', quarter)
+    query = f"""
+    SELECT [Intermediary Type], Intermediary,
+           COUNT(DISTINCT [Policy No]) as Policies,
+           SUM(Premium) as Premium
+    FROM insurance_transactions
+    WHERE {where.sql}
+    GROUP BY [Intermediary Type], Intermediary
+    """
+    df = cached_query('intermediary_rankings', (year, month, quarter), query, where.params)
+
+    df = df[df['Intermediary Type'] == intermediary_type].drop(columns='Intermediary Type')
+    df = df.sort_values('Premium', ascending=False, kind='stable')
+    df['Rank'] = df['Premium'].rank(method='min', ascending=False).astype('Int64')
+    return df.rename(columns={'Intermediary': label}).reset_index(drop=True)
+
+
+def register_intermediary_callbacks(prefix, intermediary_type, label):
+    """Register the page callbacks for one intermediary type
+
+    prefix is the component id prefix used by the page layout
+    (e.g. 'agent' for 'agent-year-filter').
+    """
+    current_year = datetime.now().year
+
+    # Only intermediaries active in the selected period, searched on the server
+    @dash.callback(
+        [Output(f'{prefix}-filter', 'options')],
+        [Input(f'{prefix}-year-filter', 'value'),
+         Input(f'{prefix}-month-filter', 'value'),
+         Input(f'{prefix}-quarter-filter', 'value'),
+         Input(f'{prefix}-filter', 'search_value')],
+        State(f'{prefix}-filter', 'value')
+    )
+    def update_options(year, month, quarter, search, intermediary):
+        selections = {'Intermediary Type': intermediary_type, 'Year': year, 'Month': month, 'Quarter': quarter}
+        return [dropdown_options('Intermediary', selections, search, selected=intermediary)]
+
+    @dash.callback(
+        [Output(f'total-{prefix}-production', 'children'),
+         Output(f'{prefix}-new-business', 'children'),
+         Output(f'{prefix}-renewals', 'children'),
+         Output(f'{prefix}-production-year', 'children'),
+         Output(f'{prefix}-new-year', 'children'),
+         Output(f'{prefix}-renewal-year', 'children')],
+        [Input(f'{prefix}-year-filter', 'value'),
+         Input(f'{prefix}-month-filter', 'value'),
+         Input(f'{prefix}-quarter-filter', 'value'),
+         Input(f'{prefix}-filter', 'value')]
+    )
+    def update_summary_cards(year, month, quarter, intermediary):
+        summary = intermediary_summary(intermediary_type, year, month, quarter, intermediary)
+        total_premium = summary['Total_Premium']
+        new_business = summary['New_Business']
+        renewals = summary['Renewal_Business']
+
+        # Format numbers with fallback to 0 if None
+        total_premium = f"{total_premium:,.2f}" if total_premium is not None else "0.00"
+        new_business = f"{new_business:,.2f}" if new_business is not None else "0.00"
+        renewals = f"{renewals:,.2f}" if renewals is not None else "0.00"
+
+        year_text = f"Year {year if year else current_year}"
+        return total_premium, new_business, renewals, year_text, year_text, year_text
+
+    @dash.callback(
+        [Output(f'{prefix}-monthly-table', 'data'),
+         Output(f'{prefix}-monthly-table', 'columns')],
+        [Input(f'{prefix}-year-filter', 'value'),
+         Input(f'{prefix}-filter', 'value')]
+    )
+    def update_monthly_table(year, intermediary):
+        df = monthly_comparison(intermediary_type, intermediary, current_year)
+        return _comparison_table(df, current_year)
+
+    @dash.callback(
+        [Output(f'{prefix}-quarterly-table', 'data'),
+         Output(f'{prefix}-quarterly-table', 'columns')],
+        [Input(f'{prefix}-year-filter', 'value'),
+         Input(f'{prefix}-filter', 'value')]
+    )
+    def update_quarterly_table(year, intermediary):
+        df = quarterly_comparison(intermediary_type, intermediary, current_year)
+        return _comparison_table(df, current_year)
+
+    @dash.callback(
+        [Output(f'{prefix}-rankings-table', 'data'),
+         Output(f'{prefix}-rankings-table', 'columns')],
+        [Input(f'{prefix}-year-filter', 'value'),
+         Input(f'{prefix}-month-filter', 'value'),
+         Input(f'{prefix}-quarter-filter', 'value')]
+    )
+    def update_rankings_table(year, month, quarter):
+        df = rankings(intermediary_type, year, month, quarter, label)
+        return table_records(df), table_columns(df, money=['Premium'])
+
+    return update_options, update_summary_cards, update_monthly_table, update_quarterly_table, update_rankings_table
+
+
+def _comparison_table(df, current_year):
+    # Difference stays numeric so the pages' {Difference} < 0 colouring compares numbers
+    columns = table_columns(df, money=[str(current_year - 1), str(current_year)], percent=['Difference'])
+    return table_records(df), columns
@@ -1,71 +1,54 @@
 import dash
-from dash import html, dcc, dash_table
+from dash import html, dcc, dash_table, Patch
 import dash_bootstrap_components as dbc
 from dash.dependencies import Input, Output, State
 import plotly.express as px
 import plotly.graph_objects as go
 import pandas as pd
-import sqlite3
 from datetime import datetime
-import io
-import base64
-import chardet
 from dash_iconify import DashIconify
+from database import create_database, data_version
+from dash.exceptions import PreventUpdate
+import ingest
+from catalogue import filter_catalogue
+from facets import dropdown_options
+from cache import result_cache
+from filters import Where
+from formatting import table_columns, table_records
+from aggregations import premium_projection, premium_summary, dashboard_frames
 
 dash.register_page(__name__, path='/')
 
 
-def create_database():
-    conn = sqlite3.connect('insurance_data.db')
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS insurance_transactions (
-        [Transaction Date] TEXT, [Policy No] TEXT, [Trans Type] TEXT, 
-        Branch TEXT, Class TEXT, [Dr/Cr No] TEXT, [Risk ID] TEXT,
-        Insured TEXT, [Intermediary Type] TEXT, Intermediary TEXT,
-        Marketer TEXT, WEF TEXT, WET TEXT, CURRENCY TEXT,
-        [Sum Insured] REAL, Premium REAL, PAID REAL,
-        Year INTEGER, [Month Name] TEXT, Month INTEGER,
-        Quarter INTEGER, Weeks INTEGER)''')
-    conn.commit()
-    conn.close()
 
-def insert_data(df):
-    expected_columns = [
-        'Transaction Date', 'Policy No', 'Trans Type', 'Branch', 'Class',
-        'Dr/Cr No', 'Risk ID', 'Insured', 'Intermediary Type', 'Intermediary',
-        'Marketer', 'WEF', 'WET', 'CURRENCY', 'Sum Insured', 'Premium', 'PAID',
-        'Year', 'Month Name', 'Month', 'Quarter', 'Weeks'
-    ]
-    
-    # Check if columns match
-    if not all(col in df.columns for col in expected_columns):
-        missing_columns = [col for col in expected_columns if col not in df.columns]
-        print(f"Missing columns in DataFrame: {missing_columns}")
-        return
-     # Convert specific columns to uppercase
-    columns_to_upper = ['Branch', 'Class', 'Insured', 'Intermediary Type', 'Intermediary', 'Marketer']
-    df[columns_to_upper] = df[columns_to_upper].apply(lambda x: x.str.upper() if x.dtype == "object" else x)
-    
-    try:
-        conn = sqlite3.connect('insurance_data.db')
-        df.to_sql('insurance_transactions', conn, if_exists='append', index=False)
-        conn.commit()
-        conn.close()
-        print("Data inserted successfully.")
-        
-    except Exception as e:
-        print(f"Error inserting data: {str(e)}")
+def dashboard_filters(trans_type, branches, class_, int_type, intermediary, marketer, currency, month_name):
+    """WHERE clause shared by the dashboard cards and charts (Year is added by the caller)"""
+    return (Where()
+            .equals('Trans Type', trans_type)
+            .isin('Branch', branches)
+            .equals('Class', class_)
+            .equals('Intermediary Type', int_type)
+            .equals('Intermediary', intermediary)
+            .equals('Marketer', marketer)
+            .equals('CURRENCY', currency)
+            .equals('Month Name', month_name))
+
+# Dropdowns filled by update_filters, in output order. Intermediary and
+# Marketer have too many values for that and are searched on the server.
+FILTER_COLUMNS = ['Trans Type', 'Branch', 'Class', 'Year', 'Intermediary Type',
+                  'CURRENCY', 'Month Name']
 
 def get_filter_options():
-    conn = sqlite3.connect('insurance_data.db')
-    query = '''SELECT DISTINCT 
-               [Trans Type], Branch, Class, Year, 
-               [Intermediary Type], Intermediary, 
-               Marketer, CURRENCY, [Month Name]
-               FROM insurance_transactions'''
-    df = pd.read_sql_query(query, conn)
-    conn.close()
-    return df
+    """Values for each filter dropdown from the in-memory catalogue"""
+    # One data version check here, then every column comes from memory
+    filter_catalogue.refresh()
+    options = {}
+    for col in FILTER_COLUMNS:
+        if col == 'Month Name':
+            options[col] = list(dict.fromkeys(name for _, name in filter_catalogue.months()))
+        else:
+            options[col] = filter_catalogue.values(col)
+    return options
 
 # Initialize the Dash app with dark theme and Bootstrap
 
@@ -120,6 +103,11 @@ dbc.Row([
                         className='upload-box mb-3 text-success'
                     ),
                     html.Div(id='output-data-upload'),
+                    html.Div([
+                        dbc.Progress(id='ingest-progress', value=0, striped=True, animated=True, className='mb-1'),
+                        html.Small(id='ingest-status', className='text-muted')
+                    ], id='ingest-progress-container', style={'display': 'none'}, className='mb-3'),
+                    dcc.Store(id='ingest-committed'),
                     dcc.Dropdown(id='trans-type-filter', placeholder="Transaction Type", className='mb-2'),
                     dcc.Dropdown(
                         id='branch-filter',
@@ -289,58 +277,23 @@ dbc.Row([
 )
 def update_summary_cards(years, branches, class_, int_type, intermediary, 
                         marketer, currency, month_name):
-    conn = sqlite3.connect('insurance_data.db')
-    
     # Build the WHERE clause based on filters
-    filters = []
-    
-    # Handle multiple branch selections
-    if branches:
-        branch_conditions = [f"Branch = '{branch}'" for branch in branches]
-        filters.append(f"({' OR '.join(branch_conditions)})")
-    
-    if class_: filters.append(f"Class = '{class_}'")
-    if int_type: filters.append(f"[Intermediary Type] = '{int_type}'")
-    if intermediary: filters.append(f"Intermediary = '{intermediary}'")
-    if marketer: filters.append(f"Marketer = '{marketer}'")
-    if currency: filters.append(f"CURRENCY = '{currency}'")
-    if month_name: filters.append(f"[Month Name] = '{month_name}'")
+    where = dashboard_filters(None, branches, class_, int_type, intermediary, marketer, currency, month_name)
     
     # Handle multiple year selections
     current_year = datetime.now().year
     if years:
-        year_conditions = [f"Year = {year}" for year in years]
-        filters.append(f"({' OR '.join(year_conditions)})")
+        where.isin('Year', years)
     else:
-        filters.append(f"Year = {current_year}")
-    
-    where_clause = " AND ".join(filters) if filters else "1=1"
-    
-    # Rest of the queries remain the same, just using the updated where_clause
-    total_query = f"""
-    SELECT SUM(Premium) as Total_Premium
-    FROM insurance_transactions
-    WHERE {where_clause}
-    """
-    
-    new_query = f"""
-    SELECT SUM(Premium) as New_Business
-    FROM insurance_transactions
-    WHERE {where_clause} AND [Trans Type] = 'New Business'
-    """
+        where.equals('Year', current_year)
     
-    renewal_query = f"""
-    SELECT SUM(Premium) as Renewal_Business
-    FROM insurance_transactions
-    WHERE {where_clause} AND [Trans Type] = 'Renewal'
-    """
-    
-    # Execute queries
-    total_premium = pd.read_sql_query(total_query, conn)['Total_Premium'].iloc[0]
-    new_business = pd.read_sql_query(new_query, conn)['New_Business'].iloc[0]
-    renewal_business = pd.read_sql_query(renewal_query, conn)['Renewal_Business'].iloc[0]
-    
-    conn.close()
+    # Card totals come from the pre-aggregated premium cube in one scan
+    cache_filters = (years or current_year, branches, class_, int_type, intermediary, marketer, currency, month_name)
+    summary = result_cache.get_or_compute('dashboard_summary', cache_filters,
+                                          lambda: premium_summary(where.sql, where.params))
+    total_premium = summary['Total_Premium']
+    new_business = summary['New_Business']
+    renewal_business = summary['Renewal_Business']
     
     # Format values
     total_formatted = f"{total_premium:,.2f}" if total_premium else "0.00"
@@ -363,15 +316,42 @@ def update_summary_cards(years, branches, class_, int_type, intermediary,
     )
 
 
-# Callback for upload status
+# Uploads run as a background job so a large file does not block the worker
+# serving everyone else's callbacks; progress is pushed while the job runs
 @dash.callback(
-    Output('output-data-upload', 'children'),
-    Input('upload-data', 'contents')
+    [Output('ingest-committed', 'data'),
+     Output('output-data-upload', 'children')],
+    Input('upload-data', 'contents'),
+    State('upload-data', 'filename'),
+    background=True,
+    progress=[Output('ingest-progress', 'value'),
+              Output('ingest-progress', 'label'),
+              Output('ingest-status', 'children')],
+    running=[(Output('upload-data', 'disabled'), True, False),
+             (Output('ingest-progress-container', 'style'), {'display': 'block'}, {'display': 'none'})],
+    prevent_initial_call=True
 )
-def update_output(contents):
-    if contents is not None:
-        return html.Div(['File uploaded successfully!'], className='success-message')
-    return html.Div()
+def run_ingest(set_progress, contents, filename):
+    if contents is None:
+        raise PreventUpdate
+    
+    def report(stats):
+        percent = int(stats['fraction'] * 100)
+        set_progress((percent, f"{percent}%",
+                      f"{stats['rows']:,} rows parsed, {stats['inserted']:,} inserted, "
+                      f"{stats['updated']:,} updated, {stats['rejected']:,} rejected"))
+    
+    try:
+        create_database()
+        stats = ingest.ingest_upload(contents, filename, progress=report)
+    except Exception as e:
+        print(f"Error processing file: {str(e)}")
+        return dash.no_update, html.Div([f"Error processing file: {str(e)}"], className='text-danger')
+    
+    print(f"Data inserted successfully: {stats['inserted']} rows, {stats['updated']} updated, {stats['rejected']} rejected.")
+    message = (f"File uploaded successfully! {stats['inserted']:,} rows inserted, "
+               f"{stats['updated']:,} updated, {stats['rejected']:,} rejected.")
+    return {'data_version': data_version(), **stats}, html.Div([message], className='success-message')
 
 # Callback to update filters
 @dash.callback(
@@ -380,39 +360,96 @@ def update_output(contents):
      Output('class-filter', 'options'),
      Output('year-filter', 'options'),
      Output('intermediary-type-filter', 'options'),
-     Output('intermediary-filter', 'options'),
-     Output('marketer-filter', 'options'),
      Output('currency-filter', 'options'),
      Output('month-name-filter', 'options')],
-    [Input('upload-data', 'contents')]
+    [Input('ingest-committed', 'data')]
 )
 
 
-def update_filters(contents):
-    if contents is not None:
-        content_type, content_string = contents.split(',')
-        decoded = base64.b64decode(content_string)
-
-        try:
-            if 'xlsx' in content_type:
-                df = pd.read_excel(io.BytesIO(decoded))
-            else:
-                result = chardet.detect(decoded)
-                encoding = result['encoding']
-                df = pd.read_csv(io.BytesIO(decoded), encoding=encoding)
-            
-            create_database()
-            insert_data(df)
-        except Exception as e:
-            print(f"Error processing file: {str(e)}")
-            return [[]] * 9
-    
+def update_filters(ingest_result):
+    # Refreshed on page load and whenever an ingest job commits
     filter_data = get_filter_options()
     return [
-        [{'label': str(x), 'value': str(x)} for x in filter_data[col].unique() if pd.notnull(x)]
-        for col in filter_data.columns
+        [{'label': str(x), 'value': str(x)} for x in filter_data[col] if pd.notnull(x)]
+        for col in FILTER_COLUMNS
     ]
 
+def facet_selections(trans_type, branches, class_, years, int_type, intermediary, marketer, currency, month_name):
+    return {'Trans Type': trans_type, 'Branch': branches, 'Class': class_, 'Year': years,
+            'Intermediary Type': int_type, 'Intermediary': intermediary, 'Marketer': marketer,
+            'CURRENCY': currency, 'Month Name': month_name}
+
+# Intermediary and Marketer list only the values that occur with the other
+# filters, most used first, and search the rest on the server as the user types
+@dash.callback(
+    Output('intermediary-filter', 'options'),
+    [Input('intermediary-filter', 'search_value'),
+     Input('trans-type-filter', 'value'),
+     Input('branch-filter', 'value'),
+     Input('class-filter', 'value'),
+     Input('year-filter', 'value'),
+     Input('intermediary-type-filter', 'value'),
+     Input('marketer-filter', 'value'),
+     Input('currency-filter', 'value'),
+     Input('month-name-filter', 'value'),
+     Input('ingest-committed', 'data')],
+    State('intermediary-filter', 'value')
+)
+def update_intermediary_options(search, trans_type, branches, class_, years, int_type,
+                                marketer, currency, month_name, ingest_result, intermediary):
+    selections = facet_selections(trans_type, branches, class_, years, int_type, intermediary,
+                                  marketer, currency, month_name)
+    return dropdown_options('Intermediary', selections, search, selected=intermediary)
+
+@dash.callback(
+    Output('marketer-filter', 'options'),
+    [Input('marketer-filter', 'search_value'),
+     Input('trans-type-filter', 'value'),
+     Input('branch-filter', 'value'),
+     Input('class-filter', 'value'),
+     Input('year-filter', 'value'),
+     Input('intermediary-type-filter', 'value'),
+     Input('intermediary-filter', 'value'),
+     Input('currency-filter', 'value'),
+     Input('month-name-filter', 'value'),
+     Input('ingest-committed', 'data')],
+    State('marketer-filter', 'value')
+)
+def update_marketer_options(search, trans_type, branches, class_, years, int_type,
+                            intermediary, currency, month_name, ingest_result, marketer):
+    selections = facet_selections(trans_type, branches, class_, years, int_type, intermediary,
+                                  marketer, currency, month_name)
+    return dropdown_options('Marketer', selections, search, selected=marketer)
+
+def chart_theme(dark_mode):
+    """Layout colours for the dashboard charts"""
+    chart_bg_color = 'rgba(50, 50, 50, 0.8)' if dark_mode else 'rgba(255, 255, 255, 1)'
+    return {
+        'plot_bgcolor': chart_bg_color,
+        'paper_bgcolor': chart_bg_color,
+        'font_color': 'white' if dark_mode else 'black',
+    }
+
+# Theme flips only patch the layout colours of the figures already on screen:
+# no queries run and the figure data is not sent again
+@dash.callback(
+    [Output('premium-trend', 'figure', allow_duplicate=True),
+     Output('quarterly-progress', 'figure', allow_duplicate=True),
+     Output('branch-premium', 'figure', allow_duplicate=True)],
+    Input('theme-switch', 'value'),
+    prevent_initial_call=True
+)
+def update_chart_theme(dark_mode):
+    colors = chart_theme(dark_mode)
+    patches = []
+    for _ in range(3):
+        patch = Patch()
+        patch['layout']['plot_bgcolor'] = colors['plot_bgcolor']
+        patch['layout']['paper_bgcolor'] = colors['paper_bgcolor']
+        patch['layout']['font']['color'] = colors['font_color']
+        patches.append(patch)
+    return patches
+
 # Callback to update charts
 @dash.callback(
     [Output('class-premium-table', 'data'),
@@ -434,13 +471,11 @@ def update_filters(contents):
      Input('intermediary-filter', 'value'),
      Input('marketer-filter', 'value'),
      Input('currency-filter', 'value'),
-     Input('month-name-filter', 'value'),
-     Input('theme-switch', 'value')]
+     Input('month-name-filter', 'value')],
+    [State('theme-switch', 'value')]
 )
 def update_charts(trans_type, branches, class_, years, int_type, intermediary, 
                  marketer, currency, month_name, dark_mode):
-    conn = sqlite3.connect('insurance_data.db')
-    
     # Handle year selection and current/previous year logic
     current_date = datetime.now()
     default_current_year = current_date.year
@@ -450,204 +485,79 @@ def update_charts(trans_type, branches, class_, years, int_type, intermediary,
         current_year = default_current_year
         years = [current_year]
     else:
+        # The dropdown sends strings; the projection's Year column is an integer
+        years = [int(year) for year in years]
         # If multiple years are selected, use the most recent one as current_year
         current_year = max(years)
     
     previous_year = int(current_year) - 1
 
     # Build the WHERE clause based on filters
-    filters = []
-    if trans_type: filters.append(f"[Trans Type] = '{trans_type}'")
-    
-    # Handle multiple branch selections
-    if branches:
-        branch_conditions = [f"Branch = '{branch}'" for branch in branches]
-        filters.append(f"({' OR '.join(branch_conditions)})")
-    
-    if class_: filters.append(f"Class = '{class_}'")
-    if int_type: filters.append(f"[Intermediary Type] = '{int_type}'")
-    if intermediary: filters.append(f"Intermediary = '{intermediary}'")
-    if marketer: filters.append(f"Marketer = '{marketer}'")
-    if currency: filters.append(f"CURRENCY = '{currency}'")
-    if month_name: filters.append(f"[Month Name] = '{month_name}'")
-    
-    base_where_clause = " AND ".join(filters) if filters else "1=1"
+    where = dashboard_filters(trans_type, branches, class_, int_type, intermediary, marketer, currency, month_name)
+    
+    # One scan for every breakdown: the projection is filtered by everything
+    # except Year so the year-on-year comparisons can share it
+    projection = result_cache.get_or_compute(
+        'dashboard_projection',
+        (trans_type, branches, class_, int_type, intermediary, marketer, currency, month_name),
+        lambda: premium_projection(where.sql, where.params)
+    )
+    frames = dashboard_frames(projection, years, current_year, previous_year)
     
     # Weekly-Monthly Premium Analysis
-    year_conditions = [f"Year = {year}" for year in years]
-    year_where_clause = f"({' OR '.join(year_conditions)})" if year_conditions else f"Year = {current_year}"
-    where_clause = f"{base_where_clause} AND {year_where_clause}"
-    
-    weekly_monthly_query = f"""
-    SELECT Weeks,
-           SUM(CASE WHEN [Month Name] = 'January' THEN Premium ELSE 0 END) as Jan,
-           SUM(CASE WHEN [Month Name] = 'February' THEN Premium ELSE 0 END) as Feb,
-           SUM(CASE WHEN [Month Name] = 'March' THEN Premium ELSE 0 END) as Mar,
-           SUM(CASE WHEN [Month Name] = 'April' THEN Premium ELSE 0 END) as Apr,
-           SUM(CASE WHEN [Month Name] = 'May' THEN Premium ELSE 0 END) as May,
-           SUM(CASE WHEN [Month Name] = 'June' THEN Premium ELSE 0 END) as Jun,
-           SUM(CASE WHEN [Month Name] = 'July' THEN Premium ELSE 0 END) as Jul,
-           SUM(CASE WHEN [Month Name] = 'August' THEN Premium ELSE 0 END) as Aug,
-           SUM(CASE WHEN [Month Name] = 'September' THEN Premium ELSE 0 END) as Sep,
-           SUM(CASE WHEN [Month Name] = 'October' THEN Premium ELSE 0 END) as Oct,
-           SUM(CASE WHEN [Month Name] = 'November' THEN Premium ELSE 0 END) as Nov,
-           SUM(CASE WHEN [Month Name] = 'December' THEN Premium ELSE 0 END) as Dec
-    FROM insurance_transactions
-    WHERE {where_clause}
-    GROUP BY Weeks
-    ORDER BY Weeks
-    """
-    weekly_monthly_df = pd.read_sql_query(weekly_monthly_query, conn)
-    
-    # Format Premium values
-    for col in weekly_monthly_df.columns:
-        if col != 'Weeks':
-            weekly_monthly_df[col] = weekly_monthly_df[col].apply(lambda x: f"{x:,.2f}")
+    weekly_monthly_df = frames['weekly_monthly']
     
-    weekly_monthly_data = weekly_monthly_df.to_dict('records')
-    weekly_monthly_columns = [{"name": i, "id": i} for i in weekly_monthly_df.columns]
+    weekly_monthly_data = table_records(weekly_monthly_df)
+    weekly_monthly_columns = table_columns(weekly_monthly_df, money=weekly_monthly_df.columns.drop('Weeks'))
     
     # Class Premium Table
-    class_query = f"""
-    SELECT Class, SUM(Premium) as Total_Premium
-    FROM insurance_transactions
-    WHERE {where_clause}
-    GROUP BY Class
-    """
-    class_df = pd.read_sql_query(class_query, conn)
+    class_df = frames['class']
     
-    # Format Premium values
-    class_df['Total_Premium'] = class_df['Total_Premium'].apply(lambda x: f"{x:,.2f}")
-    
-    table_data = class_df.to_dict('records')
-    table_columns = [{"name": i, "id": i} for i in class_df.columns]
+    class_data = table_records(class_df)
+    class_columns = table_columns(class_df, money=['Total_Premium'])
     
     # Premium Trend
-    trend_query = f"""
-    SELECT [Month Name], SUM(Premium) as Total_Premium
-    FROM insurance_transactions
-    WHERE {where_clause}
-    GROUP BY Month, [Month Name]
-    ORDER BY Month
-    """
-    trend_df = pd.read_sql_query(trend_query, conn)
+    trend_df = frames['trend']
     trend_line = px.line(trend_df, x='Month Name', y='Total_Premium',
                         title="Premium Trend by Month")
     
     # Quarterly Progress
-    quarter_query = f"""
-    SELECT Quarter, SUM(Premium) as Total_Premium
-    FROM insurance_transactions
-    WHERE {where_clause}
-    GROUP BY Quarter
-    ORDER BY Quarter
-    """
-    quarter_df = pd.read_sql_query(quarter_query, conn)
+    quarter_df = frames['quarter']
     quarter_progress = px.bar(quarter_df, x='Quarter', y='Total_Premium',
                             title="Quarterly Premium Progress")
     
     # Branch Premium
-    branch_query = f"""
-    SELECT Branch, SUM(Premium) as Total_Premium
-    FROM insurance_transactions
-    WHERE {where_clause}
-    GROUP BY Branch
-    """
-    branch_df = pd.read_sql_query(branch_query, conn)
+    branch_df = frames['branch']
     branch_chart = px.bar(branch_df, x='Branch', y='Total_Premium',
                          title="Premium by Branch")
     
     # Update chart layouts
-    chart_bg_color = 'rgba(50, 50, 50, 0.8)' if dark_mode else 'rgba(255, 255, 255, 1)'
-    font_color = 'white' if dark_mode else 'black'
-    
     for chart in [trend_line, quarter_progress, branch_chart]:
-        chart.update_layout(
-            plot_bgcolor=chart_bg_color,
-            paper_bgcolor=chart_bg_color,
-            font_color=font_color
-        )
+        chart.update_layout(**chart_theme(dark_mode))
     
     # Class Comparison Table
-    class_comparison_query = f"""
-    SELECT 
-        Class, 
-        SUM(CASE WHEN Year = {current_year} THEN Premium ELSE 0 END) as Current_Year_Premium,
-        SUM(CASE WHEN Year = {previous_year} THEN Premium ELSE 0 END) as Previous_Year_Premium,
-        ROUND(
-            (SUM(CASE WHEN Year = {current_year} THEN Premium ELSE 0 END) - 
-             SUM(CASE WHEN Year = {previous_year} THEN Premium ELSE 0 END)) * 100.0 / 
-            NULLIF(SUM(CASE WHEN Year = {previous_year} THEN Premium ELSE 0 END), 0), 
-        2) as Percentage_Change
-    FROM insurance_transactions
-    WHERE {base_where_clause}
-    GROUP BY Class
-    """
-    
-    class_comparison_df = pd.read_sql_query(class_comparison_query, conn)
-    
-    # Format values
-    class_comparison_df['Current_Year_Premium'] = class_comparison_df['Current_Year_Premium'].apply(lambda x: f"{x:,.2f}")
-    class_comparison_df['Previous_Year_Premium'] = class_comparison_df['Previous_Year_Premium'].apply(lambda x: f"{x:,.2f}")
-    class_comparison_df['Percentage_Change'] = class_comparison_df['Percentage_Change'].apply(
-    lambda x: f"{x:,.2f}%" if x is not None else "N/A"
-)
+    class_comparison_df = frames['class_comparison']
     
     # Rename columns with specific years
     class_comparison_df.columns = ['Class', f'{current_year} Premium', f'{previous_year} Premium', '% Change']
     
-    class_comparison_data = class_comparison_df.to_dict('records')
-    class_comparison_columns = [{"name": i, "id": i} for i in class_comparison_df.columns]
+    class_comparison_data = table_records(class_comparison_df)
+    class_comparison_columns = table_columns(class_comparison_df,
+                                             money=[f'{current_year} Premium', f'{previous_year} Premium'],
+                                             percent=['% Change'])
     
     # Monthly Comparison Table
-    monthly_comparison_query = f"""
-    SELECT 
-        [Month Name],
-        SUM(CASE WHEN Year = {current_year} THEN Premium ELSE 0 END) as Current_Year_Premium,
-        SUM(CASE WHEN Year = {previous_year} THEN Premium ELSE 0 END) as Previous_Year_Premium,
-        ROUND(
-            (SUM(CASE WHEN Year = {current_year} THEN Premium ELSE 0 END) - 
-             SUM(CASE WHEN Year = {previous_year} THEN Premium ELSE 0 END)) * 100.0 / 
-            NULLIF(SUM(CASE WHEN Year = {previous_year} THEN Premium ELSE 0 END), 0), 
-        2) as Percentage_Change
-    FROM insurance_transactions
-    WHERE {base_where_clause}
-    GROUP BY [Month Name]
-    ORDER BY 
-        CASE [Month Name]
-            WHEN 'January' THEN 1
-            WHEN 'February' THEN 2
-            WHEN 'March' THEN 3
-            WHEN 'April' THEN 4
-            WHEN 'May' THEN 5
-            WHEN 'June' THEN 6
-            WHEN 'July' THEN 7
-            WHEN 'August' THEN 8
-            WHEN 'September' THEN 9
-            WHEN 'October' THEN 10
-            WHEN 'November' THEN 11
-            WHEN 'December' THEN 12
-        END
-    """
-    
-    monthly_comparison_df = pd.read_sql_query(monthly_comparison_query, conn)
-    
-    # Format values
-    monthly_comparison_df['Current_Year_Premium'] = monthly_comparison_df['Current_Year_Premium'].apply(lambda x: f"{x:,.2f}")
-    monthly_comparison_df['Previous_Year_Premium'] = monthly_comparison_df['Previous_Year_Premium'].apply(lambda x: f"{x:,.2f}")
-    monthly_comparison_df['Percentage_Change'] = monthly_comparison_df['Percentage_Change'].apply(
-    lambda x: f"{x:,.2f}%" if x is not None else "N/A"
-)
+    monthly_comparison_df = frames['monthly_comparison']
     
     # Rename columns with specific years
     monthly_comparison_df.columns = ['Month', f'{current_year} Premium', f'{previous_year} Premium', '% Change']
     
-    monthly_comparison_data = monthly_comparison_df.to_dict('records')
-    monthly_comparison_columns = [{"name": i, "id": i} for i in monthly_comparison_df.columns]
-    
-    conn.close()
+    monthly_comparison_data = table_records(monthly_comparison_df)
+    monthly_comparison_columns = table_columns(monthly_comparison_df,
+                                               money=[f'{current_year} Premium', f'{previous_year} Premium'],
+                                               percent=['% Change'])
     
-    return (table_data, table_columns, 
+    return (class_data, class_columns, 
             weekly_monthly_data, weekly_monthly_columns,
             trend_line, quarter_progress, branch_chart, 
             class_comparison_data, class_comparison_columns,
@@ -2,29 +2,30 @@ import dash
 from dash import html, dcc, callback, Input, Output, State
 import dash_bootstrap_components as dbc
 from dash import dash_table
-import pandas as pd
-import sqlite3
-from datetime import datetime
-from dash.exceptions import PreventUpdate
-import io
+from database import read_sql, TRANSACTION_COLUMNS
+from deletion import count_matching, delete_where
+from catalogue import filter_catalogue
+from filters import Where
+from export import EXPORT_FORMATS, export_url
+from ingest import NUMERIC_COLUMNS, INTEGER_COLUMNS
+from dates import DATE_KEY_BOUNDS, key_date, date_range
 
 dash.register_page(__name__, path='/data')
 
 def get_filter_options():
     """Get all filter options from the database"""
-    conn = sqlite3.connect('insurance_data.db')
-    
+    filter_catalogue.refresh()
     # Get unique values for each filter
     filters = {
-        'years': pd.read_sql_query('SELECT DISTINCT Year FROM insurance_transactions ORDER BY Year', conn)['Year'].tolist(),
-        'months': pd.read_sql_query('SELECT DISTINCT Month, "Month Name" FROM insurance_transactions ORDER BY Month', conn).to_dict('records'),
-        'weeks': pd.read_sql_query('SELECT DISTINCT Weeks FROM insurance_transactions ORDER BY Weeks', conn)['Weeks'].tolist(),
-        'intermediary_types': pd.read_sql_query('SELECT DISTINCT "Intermediary Type" FROM insurance_transactions ORDER BY "Intermediary Type"', conn)['Intermediary Type'].tolist(),
-        'intermediaries': pd.read_sql_query('SELECT DISTINCT Intermediary FROM insurance_transactions ORDER BY Intermediary', conn)['Intermediary'].tolist(),
-        'classes': pd.read_sql_query('SELECT DISTINCT Class FROM insurance_transactions ORDER BY Class', conn)['Class'].tolist()
+        'years': filter_catalogue.values('Year'),
+        'months': [{'Month': month, 'Month Name': name} for month, name in filter_catalogue.months()],
+        'weeks': filter_catalogue.values('Weeks'),
+        'intermediary_types': filter_catalogue.values('Intermediary Type'),
+        'intermediaries': filter_catalogue.values('Intermediary'),
+        'classes': filter_catalogue.values('Class'),
+        'dates': [key_date(key) for key in read_sql(DATE_KEY_BOUNDS).iloc[0]]
     }
     
-    conn.close()
     return filters
 
 def build_filter_section():
@@ -92,15 +93,40 @@ def build_filter_section():
                     )
                 ], width=4)
             ]),
+            dbc.Row([
+                dbc.Col([
+                    html.Label("Transaction Date", className='text-light mb-2'),
+                    dcc.DatePickerRange(
+                        id='date-filter',
+                        min_date_allowed=filters['dates'][0],
+                        max_date_allowed=filters['dates'][1],
+                        initial_visible_month=filters['dates'][1],
+                        display_format='DD/MM/YYYY',
+                        clearable=True,
+                        className='mb-3'
+                    )
+                ], width=4)
+            ]),
             dbc.Row([
                 dbc.Col([
                     dbc.Button("Apply Filters", id="apply-filters", color="primary", className="me-2"),
                     dbc.Button("Delete Filtered Data", id="delete-data", color="danger", className="me-2"),
-                    dbc.Button("Download Excel", id="download-excel", color="success", className="me-2"),
-                    dcc.Download(id="download-dataframe-xlsx"),
+                    dbc.Button("Download", id="download-excel", color="success", className="me-2",
+                               href=export_url('xlsx', *[None] * 6), external_link=True),
+                    dcc.Dropdown(
+                        id='export-format',
+                        options=[{'label': fmt.upper(), 'value': fmt} for fmt in EXPORT_FORMATS],
+                        value='xlsx',
+                        clearable=False,
+                        className='d-inline-block align-middle',
+                        style={'width': '120px'}
+                    ),
                     dbc.Modal([
                         dbc.ModalHeader("Confirm Deletion"),
-                        dbc.ModalBody("Are you sure you want to delete the filtered data? This action cannot be undone."),
+                        dbc.ModalBody([
+                            html.P(id="delete-modal-body"),
+                            dbc.Switch(id="delete-vacuum", label="Reclaim disk space afterwards", value=False)
+                        ]),
                         dbc.ModalFooter([
                             dbc.Button("Cancel", id="cancel-delete", className="me-2"),
                             dbc.Button("Delete", id="confirm-delete", color="danger")
@@ -113,164 +139,193 @@ def build_filter_section():
         ])
     ], className="mb-4")
 
-layout = dbc.Container([
-    dbc.Row([
-        dbc.Col([
-            html.H2("Data Management", className="text-center text-light mb-4")
-        ])
-    ]),
-    
-    build_filter_section(),
-    
-    dbc.Row([
-        dbc.Col([
-            html.Div(id="filter-summary", className="mb-3"),
-            dash_table.DataTable(
-                id='filtered-data-table',
-                style_header={
-                    'backgroundColor': 'rgb(30, 30, 30)',
-                    'fontWeight': 'bold',
-                    'color': 'white'
-                },
-                style_data={
-                    'backgroundColor': 'rgb(50, 50, 50)',
-                    'color': 'white'
-                },
-                page_size=10,
-                style_table={'overflowX': 'auto'}
-            )
+# Built per page load so the dropdowns pick up uploads and deletes
+def layout(**kwargs):
+    return dbc.Container([
+        dbc.Row([
+            dbc.Col([
+                html.H2("Data Management", className="text-center text-light mb-4")
+            ])
+        ]),
+    
+        build_filter_section(),
+    
+        dbc.Row([
+            dbc.Col([
+                html.Div(id="filter-summary", className="mb-3"),
+                dash_table.DataTable(
+                    id='filtered-data-table',
+                    style_header={
+                        'backgroundColor': 'rgb(30, 30, 30)',
+                        'fontWeight': 'bold',
+                        'color': 'white'
+                    },
+                    style_data={
+                        'backgroundColor': 'rgb(50, 50, 50)',
+                        'color': 'white'
+                    },
+                    columns=[{"name": i, "id": i} for i in TRANSACTION_COLUMNS],
+                    page_current=0,
+                    page_size=10,
+                    page_action='custom',
+                    sort_action='custom',
+                    sort_mode='multi',
+                    sort_by=[],
+                    filter_action='custom',
+                    filter_query='',
+                    style_filter={
+                        'backgroundColor': 'rgb(40, 40, 40)',
+                        'color': 'white'
+                    },
+                    style_table={'overflowX': 'auto'}
+                )
+            ])
         ])
-    ])
-], fluid=True)
+    ], fluid=True)
 
-def get_filtered_data(years, months, weeks, i_types, intermediaries, classes):
-    """Helper function to get filtered data"""
-    conn = sqlite3.connect('insurance_data.db')
-    
-    conditions = []
-    if years and any(years):
-        years_str = ','.join(str(y) for y in years)
-        conditions.append(f"Year IN ({years_str})")
-    if months and any(months):
-        months_str = ','.join(str(m) for m in months)
-        conditions.append(f"Month IN ({months_str})")
-    if weeks and any(weeks):
-        weeks_str = ','.join(str(w) for w in weeks)
-        conditions.append(f"Weeks IN ({weeks_str})")
-    if i_types and any(i_types):
-        i_types_str = ','.join("'" + str(t).replace("'", "''") + "'" for t in i_types)
-        conditions.append(f'"Intermediary Type" IN ({i_types_str})')
-    if intermediaries and any(intermediaries):
-        intermediaries_str = ','.join("'" + str(i).replace("'", "''") + "'" for i in intermediaries)
-        conditions.append(f"Intermediary IN ({intermediaries_str})")
-    if classes and any(classes):
-        classes_str = ','.join("'" + str(c).replace("'", "''") + "'" for c in classes)
-        conditions.append(f"Class IN ({classes_str})")
-    
-    where_clause = " AND ".join(conditions) if conditions else "1=1"
-    query = f"SELECT * FROM insurance_transactions WHERE {where_clause}"
-    
-    df = pd.read_sql_query(query, conn)
-    conn.close()
-    return df
+def build_where_clause(years, months, weeks, i_types, intermediaries, classes, start_date=None, end_date=None):
+    """Build the WHERE clause for the data page filters"""
+    where = (Where()
+             .isin('Year', years)
+             .isin('Month', months)
+             .isin('Weeks', weeks)
+             .isin('Intermediary Type', i_types)
+             .isin('Intermediary', intermediaries)
+             .isin('Class', classes))
+    # The date range uses the indexed integer [Date Key]
+    return date_range(where, start_date, end_date)
+
+# DataTable filter_query operators, longest spelling first
+FILTER_OPERATORS = [
+    ('ge ', '>='), ('le ', '<='), ('lt ', '<'), ('gt ', '>'),
+    ('ne ', '!='), ('eq ', '='), ('contains ', 'contains'),
+    ('datestartswith ', 'datestartswith'),
+]
+
+# Unquoted filter values are compared as numbers only on these; TEXT columns
+# such as Risk ID keep '5' as written
+NUMBER_COLUMNS = NUMERIC_COLUMNS + INTEGER_COLUMNS
 
+def split_filter_part(filter_part):
+    """Split one '{column} op value' term of a DataTable filter_query"""
+    for spellings in FILTER_OPERATORS:
+        for operator_type in spellings:
+            if operator_type in filter_part:
+                name_part, value_part = filter_part.split(operator_type, 1)
+                name = name_part[name_part.find('{') + 1: name_part.rfind('}')]
+                
+                value_part = value_part.strip()
+                if value_part and value_part[0] == value_part[-1] and value_part[0] in ("'", '"', '`'):
+                    value = value_part[1:-1].replace('\\' + value_part[0], value_part[0])
+                else:
+                    value = value_part
+                    # LIKE patterns always use the text as typed
+                    if name in NUMBER_COLUMNS and spellings[1] not in ('contains', 'datestartswith'):
+                        try:
+                            value = float(value_part)
+                        except ValueError:
+                            pass
+                
+                return name, spellings[1], value
+    
+    return None, None, None
+
+def table_filter_conditions(filter_query):
+    """Translate a DataTable filter_query into SQL conditions and bound parameters"""
+    conditions, params = [], []
+    for filter_part in (filter_query or '').split(' && '):
+        name, operator, value = split_filter_part(filter_part)
+        if name not in TRANSACTION_COLUMNS:
+            continue
+        
+        if operator == 'contains':
+            conditions.append(f"[{name}] LIKE ?")
+            params.append(f"%{value}%")
+        elif operator == 'datestartswith':
+            conditions.append(f"[{name}] LIKE ?")
+            params.append(f"{value}%")
+        else:
+            conditions.append(f"[{name}] {operator} ?")
+            params.append(value)
+    
+    return conditions, params
+
+def table_order_by(sort_by):
+    """Translate DataTable sort_by into an ORDER BY clause"""
+    terms = [
+        f"[{col['column_id']}] {'ASC' if col['direction'] == 'asc' else 'DESC'}"
+        for col in sort_by or []
+        if col['column_id'] in TRANSACTION_COLUMNS
+    ]
+    return ', '.join(terms + ['rowid'])
+
+# Exports are served by the /export route in app.py, which streams rows from
+# the database; this only keeps the link in step with the filters
 @callback(
-    Output("download-dataframe-xlsx", "data"),
-    Input("download-excel", "n_clicks"),
-    [State('year-filter', 'value'),
-     State('month-filter', 'value'),
-     State('week-filter', 'value'),
-     State('intermediary-type-filter', 'value'),
-     State('intermediary-filter', 'value'),
-     State('class-filter', 'value')],
-    prevent_initial_call=True
+    Output("download-excel", "href"),
+    [Input('export-format', 'value'),
+     Input('year-filter', 'value'),
+     Input('month-filter', 'value'),
+     Input('week-filter', 'value'),
+     Input('intermediary-type-filter', 'value'),
+     Input('intermediary-filter', 'value'),
+     Input('class-filter', 'value'),
+     Input('date-filter', 'start_date'),
+     Input('date-filter', 'end_date')]
 )
-def download_xlsx(n_clicks, years, months, weeks, i_types, intermediaries, classes):
-    if not n_clicks:
-        raise PreventUpdate
-    
-    df = get_filtered_data(years, months, weeks, i_types, intermediaries, classes)
-    
-    # Create a formatted Excel file
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        df.to_excel(writer, sheet_name='Insurance Data', index=False)
-        
-        # Get workbook and worksheet objects
-        workbook = writer.book
-        worksheet = writer.sheets['Insurance Data']
-        
-        # Add formats
-        header_format = workbook.add_format({
-            'bold': True,
-            'text_wrap': True,
-            'valign': 'top',
-            'bg_color': '#D3D3D3',
-            'border': 1
-        })
-        
-        # Format the header row
-        for col_num, value in enumerate(df.columns.values):
-            worksheet.write(0, col_num, value, header_format)
-            worksheet.set_column(col_num, col_num, 15)  # Set column width
-    
-    # Generate timestamp for filename
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    
-    return dcc.send_bytes(output.getvalue(), f"insurance_data_{timestamp}.xlsx")
+def update_export_link(fmt, years, months, weeks, i_types, intermediaries, classes, start_date, end_date):
+    return export_url(fmt or 'xlsx', years, months, weeks, i_types, intermediaries, classes, start_date, end_date)
 
 @callback(
     [Output('filtered-data-table', 'data'),
-     Output('filtered-data-table', 'columns'),
+     Output('filtered-data-table', 'page_count'),
+     Output('filtered-data-table', 'page_current'),
      Output('filter-summary', 'children')],
-    [Input('apply-filters', 'n_clicks')],
+    [Input('apply-filters', 'n_clicks'),
+     Input('filtered-data-table', 'page_current'),
+     Input('filtered-data-table', 'page_size'),
+     Input('filtered-data-table', 'sort_by'),
+     Input('filtered-data-table', 'filter_query')],
     [State('year-filter', 'value'),
      State('month-filter', 'value'),
      State('week-filter', 'value'),
      State('intermediary-type-filter', 'value'),
      State('intermediary-filter', 'value'),
-     State('class-filter', 'value')]
+     State('class-filter', 'value'),
+     State('date-filter', 'start_date'),
+     State('date-filter', 'end_date')]
 )
-def update_filtered_data(n_clicks, years, months, weeks, i_types, intermediaries, classes):
+def update_filtered_data(n_clicks, page_current, page_size, sort_by, filter_query,
+                         years, months, weeks, i_types, intermediaries, classes, start_date, end_date):
+    # Only the requested page is read from the database; the total comes from COUNT(*)
     if not n_clicks:
-        # Return initial empty state or all data
-        conn = sqlite3.connect('insurance_data.db')
-        df = pd.read_sql_query('SELECT * FROM insurance_transactions', conn)
-        conn.close()
-        return df.to_dict('records'), [{"name": i, "id": i} for i in df.columns], f"Showing all {len(df)} records"
-    
-    conn = sqlite3.connect('insurance_data.db')
+        # Initial load shows all records
+        years = months = weeks = i_types = intermediaries = classes = start_date = end_date = None
     
-    # Build where clause
-    conditions = []
-    if years and any(years):
-        years_str = ','.join(str(y) for y in years)
-        conditions.append(f"Year IN ({years_str})")
-    if months and any(months):
-        months_str = ','.join(str(m) for m in months)
-        conditions.append(f"Month IN ({months_str})")
-    if weeks and any(weeks):
-        weeks_str = ','.join(str(w) for w in weeks)
-        conditions.append(f"Weeks IN ({weeks_str})")
-    if i_types and any(i_types):
-        i_types_str = ','.join("'" + str(t).replace("'", "''") + "'" for t in i_types)
-        conditions.append(f'"Intermediary Type" IN ({i_types_str})')
-    if intermediaries and any(intermediaries):
-        intermediaries_str = ','.join("'" + str(i).replace("'", "''") + "'" for i in intermediaries)
-        conditions.append(f"Intermediary IN ({intermediaries_str})")
-    if classes and any(classes):
-        classes_str = ','.join("'" + str(c).replace("'", "''") + "'" for c in classes)
-        conditions.append(f"Class IN ({classes_str})")
+    # New filters or a new sort order start again from the first page
+    triggered = {t['prop_id'] for t in dash.callback_context.triggered}
+    if triggered & {'apply-filters.n_clicks', 'filtered-data-table.sort_by', 'filtered-data-table.filter_query'}:
+        page_current = 0
+    page_current = page_current or 0
+    page_size = page_size or 10
     
-    where_clause = " AND ".join(conditions) if conditions else "1=1"
-    
-    query = f"""
-    SELECT * FROM insurance_transactions
-    WHERE {where_clause}
-    """
+    where = build_where_clause(years, months, weeks, i_types, intermediaries, classes, start_date, end_date)
+    where.extend(*table_filter_conditions(filter_query))
     
     try:
-        df = pd.read_sql_query(query, conn)
+        total = read_sql(f"SELECT COUNT(*) as Total FROM insurance_transactions WHERE {where.sql}",
+                         where.params)['Total'].iloc[0]
+        
+        page_count = max(1, -(-int(total) // page_size))
+        page_current = min(page_current, page_count - 1)
+        
+        query = f"""
+        SELECT * FROM insurance_transactions
+        WHERE {where.sql}
+        ORDER BY {table_order_by(sort_by)}
+        LIMIT ? OFFSET ?
+        """
+        df = read_sql(query, where.params + [page_size, page_current * page_size])
         
         # Create filter summary
         filter_summary = []
@@ -281,80 +336,63 @@ def update_filtered_data(n_clicks, years, months, weeks, i_types, intermediaries
         if intermediaries and any(intermediaries): filter_summary.append(f"Intermediaries: {', '.join(intermediaries)}")
         if classes and any(classes): filter_summary.append(f"Classes: {', '.join(classes)}")
         
-        summary_text = f"Showing {len(df)} records with filters: " + "; ".join(filter_summary) if filter_summary else f"Showing all {len(df)} records"
+        summary_text = f"Showing {total} records with filters: " + "; ".join(filter_summary) if filter_summary else f"Showing all {total} records"
         
-        return df.to_dict('records'), [{"name": i, "id": i} for i in df.columns], summary_text
+        return df.to_dict('records'), page_count, page_current, summary_text
     
     except Exception as e:
         print(f"Error executing query: {e}")
-        return [], [], "Error filtering data"
-    
-    finally:
-        conn.close()
+        return [], 1, 0, "Error filtering data"
         
         
 
 
 @callback(
     [Output("delete-modal", "is_open"),
-     Output('apply-filters', 'n_clicks')],  # Add this to trigger filter refresh
+     Output('apply-filters', 'n_clicks'),  # Add this to trigger filter refresh
+     Output("delete-modal-body", "children"),
+     Output("confirm-delete", "disabled")],
     [Input("delete-data", "n_clicks"),
      Input("cancel-delete", "n_clicks"),
      Input("confirm-delete", "n_clicks")],
     [State("delete-modal", "is_open"),
+     State("delete-vacuum", "value"),
      State('year-filter', 'value'),
      State('month-filter', 'value'),
      State('week-filter', 'value'),
      State('intermediary-type-filter', 'value'),
      State('intermediary-filter', 'value'),
-     State('class-filter', 'value')]
+     State('class-filter', 'value'),
+     State('date-filter', 'start_date'),
+     State('date-filter', 'end_date')]
 )
-def toggle_delete_modal(delete_n, cancel_n, confirm_n, is_open, years, months, weeks, i_types, intermediaries, classes):
+def toggle_delete_modal(delete_n, cancel_n, confirm_n, is_open, vacuum, years, months, weeks, i_types, intermediaries, classes,
+                        start_date, end_date):
     triggered_id = dash.callback_context.triggered[0]['prop_id'].split('.')[0]
+    where = build_where_clause(years, months, weeks, i_types, intermediaries, classes, start_date, end_date)
     
     if triggered_id == "confirm-delete" and confirm_n:
-        conn = sqlite3.connect('insurance_data.db')
-        cursor = conn.cursor()
-        
-        # Build where clause
-        conditions = []
-        if years and any(years):
-            years_str = ','.join(str(y) for y in years)
-            conditions.append(f"Year IN ({years_str})")
-        if months and any(months):
-            months_str = ','.join(str(m) for m in months)
-            conditions.append(f"Month IN ({months_str})")
-        if weeks and any(weeks):
-            weeks_str = ','.join(str(w) for w in weeks)
-            conditions.append(f"Weeks IN ({weeks_str})")
-        if i_types and any(i_types):
-            i_types_str = ','.join("'" + str(t).replace("'", "''") + "'" for t in i_types)
-            conditions.append(f'"Intermediary Type" IN ({i_types_str})')
-        if intermediaries and any(intermediaries):
-            intermediaries_str = ','.join("'" + str(i).replace("'", "''") + "'" for i in intermediaries)
-            conditions.append(f"Intermediary IN ({intermediaries_str})")
-        if classes and any(classes):
-            classes_str = ','.join("'" + str(c).replace("'", "''") + "'" for c in classes)
-            conditions.append(f"Class IN ({classes_str})")
-        
-        where_clause = " AND ".join(conditions) if conditions else "1=1"
-        
-        delete_query = f"""
-        DELETE FROM insurance_transactions
-        WHERE {where_clause}
-        """
-        
-        cursor.execute(delete_query)
-        conn.commit()
-        conn.close()
+        try:
+            delete_where(where, vacuum=bool(vacuum))
+        except Exception as e:
+            print(f"Error deleting data: {str(e)}")
+            return True, dash.no_update, f"Error deleting data: {str(e)}", True
         
         # Return False for modal and increment n_clicks to trigger filter refresh
-        return False, (confirm_n or 0) + 1
+        return False, (confirm_n or 0) + 1, dash.no_update, dash.no_update
+    
+    elif triggered_id == "delete-data" and not is_open:
+        # Preview how many rows the current filters would remove
+        count = count_matching(where)
+        if not count:
+            return True, dash.no_update, "No transactions match the current filters.", True
+        message = f"Delete {count:,} transaction(s) matching the current filters? This action cannot be undone."
+        return True, dash.no_update, message, False
     
     elif triggered_id in ["delete-data", "cancel-delete"]:
-        return not is_open, dash.no_update
+        return not is_open, dash.no_update, dash.no_update, dash.no_update
     
-    return is_open, dash.no_update
+    return is_open, dash.no_update, dash.no_update, dash.no_update
 
 
 
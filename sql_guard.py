@@ -0,0 +1,111 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from pathlib import Path
+
+from database import DB_PATH
+
+
+# Seconds an agent query may run before it is interrupted, override with AGENT_SQL_TIMEOUT
+AGENT_SQL_TIMEOUT = float(os.getenv('AGENT_SQL_TIMEOUT', '10'))
+
+# Rows returned when the query (or the tool call) sets no smaller limit
+AGENT_SQL_ROW_LIMIT = int(os.getenv('AGENT_SQL_ROW_LIMIT', '1000'))
+
+# Approximate size of a result, in KB, before the remaining rows are dropped
+AGENT_SQL_MAX_KB = int(os.getenv('AGENT_SQL_MAX_KB', '256'))
+
+# JSON lines file with the cost of every agent query; empty turns it off
+AGENT_SQL_LOG = os.getenv('AGENT_SQL_LOG', 'agent_sql.log')
+
+# SQLite virtual machine instructions between timeout checks
+_PROGRESS_STEPS = 10000
+
+_ROW_RETURNING = ('select', 'with', 'values')
+
+_log_lock = threading.Lock()
+
+
+class QueryTimeout(Exception):
+    """Raised when an agent query runs longer than AGENT_SQL_TIMEOUT"""
+
+
+def connect_readonly(path=DB_PATH):
+    """Connection that SQLite itself refuses to write through"""
+    conn = sqlite3.connect(f"{Path(path).resolve().as_uri()}?mode=ro", uri=True,
+                           timeout=AGENT_SQL_TIMEOUT, check_same_thread=False)
+    conn.execute('PRAGMA query_only = ON')
+    # Small page cache so agent scans do not crowd out the dashboard's
+    conn.execute('PRAGMA cache_size = -16384')
+    return conn
+
+
+def with_limit(sql, limit):
+    """Wrap a row-returning statement so it yields at most limit + 1 rows
+
+    The extra row tells whether the result was cut off. Other statements are
+    returned unchanged.
+    """
+    sql = sql.strip().rstrip(';').strip()
+    words = sql.split(None, 1)
+    if not words or words[0].lower() not in _ROW_RETURNING:
+        return sql
+    return f"SELECT * FROM ({sql}\n) LIMIT {int(limit) + 1}"
+
+
+def log_cost(entry):
+    if not AGENT_SQL_LOG:
+        return
+    with _log_lock, open(AGENT_SQL_LOG, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(entry, default=str) + '\n')
+
+
+def run_guarded(sql, limit=None, timeout=AGENT_SQL_TIMEOUT, max_kb=AGENT_SQL_MAX_KB):
+    """Run an agent's SQL read-only, time-boxed and size-capped
+
+    Returns (rows as dicts, note) where note says why rows were left out, or
+    None. Raises QueryTimeout, or sqlite3.Error for invalid or writing SQL.
+    """
+    limit = min(int(limit), AGENT_SQL_ROW_LIMIT) if limit else AGENT_SQL_ROW_LIMIT
+    max_bytes = max_kb * 1024
+    started = time.monotonic()
+    deadline = started + timeout
+    steps = [0]
+
+    def progress():
+        steps[0] += 1
+        return time.monotonic() > deadline
+
+    entry = {'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'sql': sql, 'limit': limit}
+    rows, note, size = [], None, 0
+    conn = connect_readonly()
+    try:
+        conn.set_progress_handler(progress, _PROGRESS_STEPS)
+        cursor = conn.execute(with_limit(sql, limit))
+        columns = [col[0] for col in cursor.description or []]
+        for row in cursor:
+            if len(rows) == limit:
+                note = f"only the first {limit} rows are shown"
+                break
+            size += len(repr(row))
+            if size > max_bytes:
+                note = f"result cut to {len(rows)} rows at {max_kb} KB"
+                break
+            rows.append(dict(zip(columns, row)))
+    except sqlite3.OperationalError as e:
+        if time.monotonic() > deadline:
+            entry['error'] = 'timeout'
+            raise QueryTimeout(f"Query stopped after {timeout:g} seconds; narrow it down or aggregate") from e
+        entry['error'] = str(e)
+        raise
+    except sqlite3.Error as e:
+        entry['error'] = str(e)
+        raise
+    finally:
+        conn.close()
+        entry.update(duration_ms=round((time.monotonic() - started) * 1000, 1),
+                     vm_steps=steps[0] * _PROGRESS_STEPS, rows=len(rows), bytes=size, truncated=note)
+        log_cost(entry)
+    return rows, note
@@ -4,9 +4,34 @@ import numpy as np
 import pandas as pd
 from tabulate import tabulate
 from phi.tools.sql import SQLTools
+from sql_guard import run_guarded
 
 
 class SQLStatsTools(SQLTools):
+    def run_sql(self, sql: str, limit: Optional[int] = None) -> list:
+        """Run SQL through sql_guard: read-only, time-boxed and row/size capped"""
+        rows, _ = run_guarded(sql, limit)
+        return rows
+
+    def run_sql_query(self, query: str, limit: Optional[int] = 10) -> str:
+        """
+        Run a read-only SQL query and return the result as JSON.
+        Queries that run too long are stopped, so aggregate in SQL instead of fetching raw rows.
+        
+        Args:
+            query (str): The SQLite query to run
+            limit (int): Maximum number of rows to return (default: 10)
+            
+        Returns:
+            str: JSON list of rows, followed by a note if rows were left out
+        """
+        try:
+            rows, note = run_guarded(query, limit)
+        except Exception as e:
+            return f"Error running query: {str(e)}"
+        result = json.dumps(rows, default=str)
+        return f"{result}\n({note})" if note else result
+
     def calculate_column_stats(self, table_name: str, column_name: str) -> str:
         """
         Calculate basic statistics for a numeric column in a table.